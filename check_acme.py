@@ -5,9 +5,20 @@ import sys
 import argparse
 import os
 import requests
+import collections
 import concurrent.futures
+import csv
+import functools
+import math
+import re
+import shlex
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+from check_machines import adaptive_timeout, percentile
+
 # Load environment variables from .env file
 env_file = Path(__file__).parent / ".env"
 if env_file.exists():
@@ -23,8 +34,19 @@ HEAD_NODE_IP = os.getenv("HEAD_NODE_IP")
 HEAD_NODE_USER = os.getenv("HEAD_NODE_USER")
 
 # List of nodes: node01, node02... node20
+# Used when --inventory is "static", or when discovery fails and no cache exists
 NODES = [f"node{i:02d}" for i in range(1, 21)]
 
+# Node discovery on the head node (--inventory slurm|hosts); discovered lists
+# are cached locally and reused until the cache is older than the TTL
+NODE_PATTERN = re.compile(os.getenv("ACME_NODE_PATTERN", r"^node\d+$"))
+INVENTORY_CACHE = Path(__file__).parent / ".acme_nodes.json"
+INVENTORY_CACHE_TTL = 3600
+INVENTORY_COMMANDS = {
+    "slurm": "sinfo -h -N -o '%N'",
+    "hosts": "getent hosts || cat /etc/hosts",
+}
+
 # Load credentials from environment variables
 SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_ACME")
 SSH_PASSWORD = os.getenv("SSH_PASSWORD")
@@ -35,75 +57,496 @@ PING_TIMEOUT = 1
 MAX_WORKERS = 5
 RETRY_ATTEMPTS = 1
 
+# Adaptive concurrency: the number of in-flight probes is resized during a
+# sweep so the remaining nodes finish within SWEEP_BUDGET seconds. The cap
+# stays at the head node's sshd MaxSessions (default 10), since every
+# in-flight probe is a channel on the shared connection.
+MIN_WORKERS = 2
+MAX_WORKERS_CAP = 10
+SWEEP_BUDGET = 30
+
+# Deep mode (--deep): one tunnelled SSH session per up node, through
+# direct-tcpip channels of the head node connection, collecting load, memory
+# and disk usage. Nodes above any threshold are summarised in Slack.
+NODE_USER = os.getenv("ACME_NODE_USER") or HEAD_NODE_USER
+DEEP_WORKERS = 16
+DEEP_DISK_PATHS = ["/", "/tmp", "/scratch"]
+LOAD_THRESHOLD = 1.0         # 1-minute load per core
+MEM_USED_THRESHOLD = 90.0    # percent of MemTotal not available
+DISK_USED_THRESHOLD = 90.0   # percent of filesystem used
+
+# Probe history: one compact CSV record per probe, appended to a daily
+# segment file; segments older than the retention window are deleted
+HISTORY_DIR = Path(__file__).parent / ".acme_history"
+HISTORY_RETENTION_DAYS = 30
+FLAP_THRESHOLD = 3           # up/down transitions in the window that flag a node
+RTT_CREEP_FACTOR = 2.0       # recent median RTT vs earlier median that flags a node
+
+# Adaptive timeouts: each node's ping timeout and the head node connect
+# timeout are check_machines.adaptive_timeout (TIMEOUT_FACTOR x the
+# TIMEOUT_PERCENTILE set there) of the RTTs and handshakes recorded over the
+# last TIMEOUT_HISTORY_DAYS, clamped to the limits below. With fewer than
+# TIMEOUT_MIN_SAMPLES samples the fixed PING_TIMEOUT / SSH_TIMEOUT apply.
+# ping -W takes whole seconds.
+TIMEOUT_HISTORY_DAYS = 7
+TIMEOUT_MIN_SAMPLES = 5
+PING_TIMEOUT_LIMITS = (1, 5)
+SSH_TIMEOUT_LIMITS = (3.0, 30.0)
+ADAPTIVE_TIMEOUTS = {"ping": {}, "connect": None}  # filled by load_adaptive_timeouts()
+
+# Watch mode: keepalive on the head node connection and reconnect backoff cap
+KEEPALIVE_INTERVAL = 15
+RECONNECT_BACKOFF_MAX = 300
+
 # --- CORE LOGIC ---
 
-def check_node_via_jump(node_hostname, retry=True):
+def connect_head_node():
     """
-    Connects to head node and attempts to reach the target node.
-    Returns tuple of (node_hostname, is_up, error_message)
+    Opens an authenticated SSH connection to the head node.
+    Returns tuple of (client, handshake_seconds)
     """
-    gateway = None
+    gateway = paramiko.SSHClient()
+    gateway.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+    # This assumes SSH keys are set up for passwordless access
+    start = time.monotonic()
+    gateway.connect(
+        HEAD_NODE_IP,
+        username=HEAD_NODE_USER,
+        password=SSH_PASSWORD,
+        timeout=ADAPTIVE_TIMEOUTS["connect"] or SSH_TIMEOUT
+    )
+    gateway.get_transport().set_keepalive(KEEPALIVE_INTERVAL)
+    return gateway, time.monotonic() - start
+
+def parse_ping_rtt(output):
+    """Returns the round-trip time in ms from ping output, or None if absent."""
+    match = re.search(r"time[=<]([0-9.]+)", output)
+    return float(match.group(1)) if match else None
+
+def check_node_via_jump(node_hostname, gateway=None, retry=True):
+    """
+    Attempts to reach the target node from the head node.
+    If a connected gateway is given, the ping runs on a new channel of its
+    transport; otherwise a dedicated connection is opened for this node.
+    Returns tuple of (node_hostname, is_up, error_message, rtt_ms, retries_used)
+    """
+    own_gateway = gateway is None
     try:
         # Connect to the Head Node
-        gateway = paramiko.SSHClient()
-        gateway.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-        # This assumes SSH keys are set up for passwordless access
-        gateway.connect(
-            HEAD_NODE_IP,
-            username=HEAD_NODE_USER,
-            password=SSH_PASSWORD,
-            timeout=SSH_TIMEOUT
-        )
+        if own_gateway:
+            gateway, _ = connect_head_node()
 
         # Execute ping check from the head node
         _, stdout, _ = gateway.exec_command(
-            f"ping -c 1 -W {PING_TIMEOUT} {node_hostname}"
+            f"ping -c 1 -W {node_ping_timeout(node_hostname)} {node_hostname}",
+            timeout=SSH_TIMEOUT
         )
 
         # Wait for command to finish
+        output = stdout.read().decode("utf-8", errors="replace")
         exit_status = stdout.channel.recv_exit_status()
 
         is_up = exit_status == 0
 
-        # Retry once if node appears down
+        # Retry once if node appears down (on the same connection)
         if not is_up and retry and RETRY_ATTEMPTS > 0:
-            return check_node_via_jump(node_hostname, retry=False)
+            result = check_node_via_jump(node_hostname, gateway=gateway, retry=False)
+            return result[:4] + (1,)
 
-        return node_hostname, is_up, None
+        return node_hostname, is_up, None, parse_ping_rtt(output) if is_up else None, 0
 
     except paramiko.AuthenticationException as e:
         error_msg = f"Authentication failed: {str(e)}"
         print(f"Error connecting to {node_hostname} via {HEAD_NODE_IP}: {error_msg}", file=sys.stderr)
-        return node_hostname, False, error_msg
+        return node_hostname, False, error_msg, None, 0
     except paramiko.SSHException as e:
         error_msg = f"SSH error: {str(e)}"
         print(f"Error connecting to {node_hostname} via {HEAD_NODE_IP}: {error_msg}", file=sys.stderr)
-        return node_hostname, False, error_msg
+        return node_hostname, False, error_msg, None, 0
     except Exception as e:
         error_msg = f"Unexpected error: {str(e)}"
         print(f"Error connecting to {node_hostname} via {HEAD_NODE_IP}: {error_msg}", file=sys.stderr)
-        return node_hostname, False, error_msg
+        return node_hostname, False, error_msg, None, 0
     finally:
-        if gateway:
+        if own_gateway and gateway:
             gateway.close()
 
-def send_slack_alert(down_nodes):
-    if not SLACK_WEBHOOK_URL:
-        raise ValueError("SLACK_WEBHOOK_URL environment variable is not set")
+# Remote probe script for batch mode: pings every node given as a
+# "<node>=<timeout>" argument in parallel on the head node and prints one
+# "PROBE <node> <up|down> <rtt_ms|-> <retries_used>" line per node as soon as
+# its ping finishes.
+BATCH_PROBE_SCRIPT = """
+probe() {
+    n=${1%%=*}
+    w=${1##*=}
+    used=0
+    while :; do
+        if out=$(ping -c 1 -W "$w" "$n" 2>&1); then
+            rtt=$(printf '%%s\\n' "$out" | sed -n 's/.*time[=<]\\([0-9.]*\\).*/\\1/p' | head -n 1)
+            echo "PROBE $n up ${rtt:--} $used"
+            return
+        fi
+        [ "$used" -ge "$2" ] && break
+        used=$((used + 1))
+    done
+    echo "PROBE $n down - $used"
+}
+for n in "$@"; do
+    probe "$n" %(retries)d &
+done
+wait
+"""
+
+def parse_probe_line(line):
+    """
+    Parses one result line of the batch probe script.
+    Returns tuple of (node_hostname, is_up, rtt_ms, retries_used), or None for other output
+    """
+    parts = line.split()
+    if len(parts) != 5 or parts[0] != "PROBE":
+        return None
+    _, node_hostname, state, rtt, retries = parts
+    try:
+        rtt_ms = float(rtt)
+    except ValueError:
+        rtt_ms = None
+    return node_hostname, state == "up", rtt_ms, int(retries)
 
-    message = {
-        "text": "🚨 *ACME Alert: Internal Nodes Down!*",
-        "attachments": [{
-            "color": "danger",
-            "text": f"The following nodes are unreachable from head node ({HEAD_NODE_IP}):\n" +
-                    ", ".join([f"`{n}`" for n in down_nodes])
-        }]
+def check_nodes_batch(gateway, nodes, verbose=True, via=None):
+    """
+    Probes all nodes with a single remote command on the head node (or the
+    jump host named by via, for messages).
+    Result lines are parsed as they stream back; nodes that never report
+    are counted as down.
+    Returns list of (node_hostname, is_up, error_message, rtt_ms, retries_used)
+    in the order of nodes
+    """
+    script = BATCH_PROBE_SCRIPT % {"retries": RETRY_ATTEMPTS}
+    timeouts = {n: node_ping_timeout(n) for n in nodes}
+    command = "sh -c " + shlex.quote(script) + " probe " + " ".join(
+        shlex.quote(f"{n}={timeouts[n]}") for n in nodes
+    )
+    # Worst case is every ping attempt on the slowest node timing out
+    read_timeout = SSH_TIMEOUT + max(timeouts.values(), default=PING_TIMEOUT) * (RETRY_ATTEMPTS + 1)
+
+    reported = {}
+    error_msg = None
+    try:
+        _, stdout, _ = gateway.exec_command(command, timeout=read_timeout)
+        for line in stdout:
+            parsed = parse_probe_line(line)
+            if parsed is None:
+                continue
+            node_hostname, is_up, rtt_ms, retries = parsed
+            reported[node_hostname] = (is_up, rtt_ms, retries)
+            if verbose:
+                rtt_str = f"{rtt_ms:.2f} ms" if rtt_ms is not None else "-"
+                print(f"  {node_hostname:<10} {'up' if is_up else 'down':<5} {rtt_str}")
+    except Exception as e:
+        error_msg = f"Batch probe failed: {str(e)}"
+        print(f"Error probing nodes via {via or HEAD_NODE_IP}: {error_msg}", file=sys.stderr)
+
+    results = []
+    for node_hostname in nodes:
+        if node_hostname in reported:
+            is_up, rtt_ms, retries = reported[node_hostname]
+            results.append((node_hostname, is_up, None, rtt_ms, retries))
+        else:
+            results.append((node_hostname, False, error_msg or "No result from batch probe", None, 0))
+    return results
+
+def parse_inventory(text):
+    """
+    Extracts node hostnames from sinfo, getent/hosts-file or plain list output.
+    Keeps names matching NODE_PATTERN, in order of first appearance.
+    Returns list of node hostnames
+    """
+    nodes = []
+    seen = set()
+    for line in text.splitlines():
+        line = line.split("#", 1)[0]
+        for name in line.split():
+            if NODE_PATTERN.match(name) and name not in seen:
+                seen.add(name)
+                nodes.append(name)
+    return nodes
+
+def read_inventory_cache(source, max_age=INVENTORY_CACHE_TTL):
+    """Returns the cached node list for source, or None if missing or older than max_age."""
+    try:
+        with open(INVENTORY_CACHE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cache.get("source") != source or time.time() - cache.get("updated", 0) > max_age:
+        return None
+    return cache.get("nodes") or None
+
+def write_inventory_cache(source, nodes):
+    try:
+        with open(INVENTORY_CACHE, "w") as f:
+            json.dump({"source": source, "updated": time.time(), "nodes": nodes}, f)
+    except OSError as e:
+        print(f"Warning: cannot write node cache {INVENTORY_CACHE}: {e}", file=sys.stderr)
+
+def load_nodes(gateway, source="static"):
+    """
+    Resolves the list of nodes to check.
+    source is "static" (NODES), "slurm" or "hosts" (discovered on the head
+    node, cached locally), or a path to a local file with one node per line.
+    Falls back to a stale cache, then to NODES, if discovery fails.
+    """
+    if source == "static":
+        return NODES
+
+    if source not in INVENTORY_COMMANDS:
+        with open(source) as f:
+            return parse_inventory(f.read())
+
+    nodes = read_inventory_cache(source)
+    if nodes:
+        return nodes
+
+    try:
+        _, stdout, _ = gateway.exec_command(INVENTORY_COMMANDS[source], timeout=SSH_TIMEOUT)
+        nodes = parse_inventory(stdout.read().decode("utf-8", errors="replace"))
+    except Exception as e:
+        print(f"Warning: node discovery via {source} failed: {e}", file=sys.stderr)
+        nodes = []
+
+    if nodes:
+        write_inventory_cache(source, nodes)
+        return nodes
+
+    nodes = read_inventory_cache(source, max_age=float("inf"))
+    if nodes:
+        print(f"Warning: using stale {source} node cache ({len(nodes)} nodes)", file=sys.stderr)
+        return nodes
+    print(f"Warning: no nodes discovered via {source}, using default node list", file=sys.stderr)
+    return NODES
+
+def parse_node_health(node_hostname, output):
+    """
+    Parses the output of the deep mode metrics command.
+    Returns a per-node record dict with load, cores, memory and disk usage
+    """
+    lines = output.strip().splitlines()
+    load1, load5, load15 = (float(x) for x in lines[0].split()[:3])
+    meminfo = {}
+    disks = {}
+    for line in lines[2:]:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].endswith(":"):
+            meminfo[parts[0][:-1]] = int(parts[1])
+        elif len(parts) >= 6 and parts[4].endswith("%"):
+            disks[parts[5]] = float(parts[4][:-1])
+
+    mem_total = meminfo.get("MemTotal", 0)
+    mem_avail = meminfo.get("MemAvailable", meminfo.get("MemFree", 0))
+    return {
+        "node": node_hostname,
+        "load1": load1,
+        "load5": load5,
+        "load15": load15,
+        "cores": int(lines[1]),
+        "mem_total_kb": mem_total,
+        "mem_used_pct": 100.0 * (mem_total - mem_avail) / mem_total if mem_total else 0.0,
+        "disk_used_pct": disks,
+        "error": None,
+    }
+
+def node_health_issues(record):
+    """Returns a list of short descriptions of thresholds the node record exceeds."""
+    if record["error"]:
+        return [record["error"]]
+    issues = []
+    if record["load1"] > LOAD_THRESHOLD * record["cores"]:
+        issues.append(f"load {record['load1']:.1f}/{record['cores']}")
+    if record["mem_used_pct"] > MEM_USED_THRESHOLD:
+        issues.append(f"mem {record['mem_used_pct']:.0f}%")
+    for mount, used in record["disk_used_pct"].items():
+        if used > DISK_USED_THRESHOLD:
+            issues.append(f"{mount} {used:.0f}%")
+    return issues
+
+def check_node_health(node_hostname, gateway):
+    """
+    Opens an SSH session to the node tunnelled through a direct-tcpip channel
+    of the head node connection and collects load, memory and disk usage
+    with a single command.
+    Returns a per-node record dict (see parse_node_health); on failure all
+    metrics are None and error is set
+    """
+    client = None
+    try:
+        channel = gateway.get_transport().open_channel(
+            "direct-tcpip", (node_hostname, 22), ("127.0.0.1", 0), timeout=SSH_TIMEOUT
+        )
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            node_hostname,
+            username=NODE_USER,
+            password=SSH_PASSWORD,
+            sock=channel,
+            timeout=SSH_TIMEOUT
+        )
+        disk_paths = " ".join(shlex.quote(p) for p in DEEP_DISK_PATHS)
+        _, stdout, _ = client.exec_command(
+            "cat /proc/loadavg; nproc; grep -E '^(MemTotal|MemAvailable|MemFree):' /proc/meminfo; "
+            f"df -P -k {disk_paths} 2>/dev/null",
+            timeout=SSH_TIMEOUT
+        )
+        return parse_node_health(node_hostname, stdout.read().decode("utf-8", errors="replace"))
+    except Exception as e:
+        return {
+            "node": node_hostname, "load1": None, "load5": None, "load15": None,
+            "cores": None, "mem_total_kb": None, "mem_used_pct": None,
+            "disk_used_pct": {}, "error": f"Health check failed: {str(e)}",
+        }
+    finally:
+        if client:
+            client.close()
+
+def collect_node_health(gateway, nodes):
+    """
+    Runs check_node_health for every node on a bounded pool of tunnelled sessions.
+    Returns list of per-node records in the order of nodes
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=DEEP_WORKERS) as executor:
+        return list(executor.map(functools.partial(check_node_health, gateway=gateway), nodes))
+
+def record_history(results, handshake_time):
+    """
+    Appends one (timestamp, node, up, rtt_ms, handshake_ms, retries) record
+    per probe result to today's history segment, then deletes segments
+    older than HISTORY_RETENTION_DAYS.
+    """
+    now = datetime.now(timezone.utc)
+    timestamp = int(now.timestamp())
+    handshake_ms = f"{handshake_time * 1000:.1f}" if handshake_time is not None else ""
+    try:
+        HISTORY_DIR.mkdir(exist_ok=True)
+        with open(HISTORY_DIR / f"{now:%Y-%m-%d}.csv", "a", newline="") as f:
+            writer = csv.writer(f)
+            for name, is_up, _, rtt_ms, retries in results:
+                rtt = f"{rtt_ms:.3f}" if rtt_ms is not None else ""
+                writer.writerow([timestamp, name, int(is_up), rtt, handshake_ms, retries])
+
+        cutoff = f"{now - timedelta(days=HISTORY_RETENTION_DAYS):%Y-%m-%d}"
+        for segment in HISTORY_DIR.glob("*.csv"):
+            if segment.stem < cutoff:
+                segment.unlink()
+    except OSError as e:
+        print(f"Warning: cannot write probe history to {HISTORY_DIR}: {e}", file=sys.stderr)
+
+def history_rows(days):
+    """Yields the raw CSV rows of the history segments for the last `days` days."""
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    first_segment = f"{since:%Y-%m-%d}"
+    for segment in sorted(HISTORY_DIR.glob("*.csv")):
+        if segment.stem < first_segment:
+            continue
+        with open(segment, newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 6 or int(row[0]) < since.timestamp():
+                    continue
+                yield row
+
+def load_history(days):
+    """Returns the history records of the last `days` days as (timestamp, node, is_up, rtt_ms) tuples."""
+    return [(int(row[0]), row[1], row[2] == "1", float(row[3]) if row[3] else None)
+            for row in history_rows(days)]
+
+def load_adaptive_timeouts(days=TIMEOUT_HISTORY_DAYS):
+    """
+    Sets per-node ping timeouts and the head node connect timeout in
+    ADAPTIVE_TIMEOUTS from the RTTs and handshakes in the probe history.
+    """
+    rtts = collections.defaultdict(list)
+    handshakes = {}  # one handshake per sweep, repeated on every row
+    try:
+        for row in history_rows(days):
+            if row[2] == "1" and row[3]:
+                rtts[row[1]].append(float(row[3]) / 1000)
+            if row[4]:
+                handshakes[row[0]] = float(row[4]) / 1000
+    except (OSError, ValueError) as e:
+        print(f"Warning: cannot read probe history for adaptive timeouts: {e}", file=sys.stderr)
+        return
+
+    ADAPTIVE_TIMEOUTS["ping"] = {
+        node: math.ceil(adaptive_timeout(samples, PING_TIMEOUT, PING_TIMEOUT_LIMITS, TIMEOUT_MIN_SAMPLES))
+        for node, samples in rtts.items()
     }
+    ADAPTIVE_TIMEOUTS["connect"] = adaptive_timeout(list(handshakes.values()), SSH_TIMEOUT, SSH_TIMEOUT_LIMITS,
+                                                    TIMEOUT_MIN_SAMPLES)
+
+def node_ping_timeout(node_hostname):
+    """Returns the ping timeout in whole seconds for node_hostname."""
+    return ADAPTIVE_TIMEOUTS["ping"].get(node_hostname, PING_TIMEOUT)
+
+def summarize_history(records):
+    """
+    Aggregates history records per node.
+    Returns dict of node -> {samples, up_pct, p50, p95, flaps, creeping}
+    """
+    by_node = collections.defaultdict(list)
+    for record in sorted(records, key=lambda r: r[0]):
+        by_node[record[1]].append(record)
+
+    summary = {}
+    for node, node_records in by_node.items():
+        states = [is_up for _, _, is_up, _ in node_records]
+        rtts = [rtt for _, _, is_up, rtt in node_records if is_up and rtt is not None]
+        flaps = sum(1 for a, b in zip(states, states[1:]) if a != b)
+
+        # Compare the median RTT of the recent half of the window with the earlier half
+        half = len(rtts) // 2
+        creeping = (half >= 2 and statistics.median(rtts[:half]) > 0 and
+                    statistics.median(rtts[half:]) > RTT_CREEP_FACTOR * statistics.median(rtts[:half]))
+
+        summary[node] = {
+            "samples": len(states),
+            "up_pct": 100.0 * sum(states) / len(states),
+            "p50": percentile(rtts, 50) if rtts else None,
+            "p95": percentile(rtts, 95) if rtts else None,
+            "flaps": flaps,
+            "creeping": creeping,
+        }
+    return summary
+
+def print_history(days=7):
+    """Prints per-node latency percentiles and flags flapping or slowing nodes."""
+    summary = summarize_history(load_history(days))
+    if not summary:
+        print(f"No probe history in the last {days} day(s) (stored in {HISTORY_DIR}/).")
+        return
+
+    print(f"\n{'='*70}")
+    print(f"  ACME node latency, last {days} day(s)")
+    print(f"{'='*70}")
+    print(f"  {'Node':<10} {'Samples':>8} {'Up %':>7} {'p50 ms':>8} {'p95 ms':>8} {'Flaps':>6}  Flags")
+    for node in sorted(summary):
+        d = summary[node]
+        p50 = f"{d['p50']:.2f}" if d["p50"] is not None else "-"
+        p95 = f"{d['p95']:.2f}" if d["p95"] is not None else "-"
+        flags = []
+        if d["flaps"] >= FLAP_THRESHOLD:
+            flags.append("FLAPPING")
+        if d["creeping"]:
+            flags.append("RTT RISING")
+        print(f"  {node:<10} {d['samples']:>8} {d['up_pct']:>6.1f}% {p50:>8} {p95:>8} {d['flaps']:>6}  {' '.join(flags)}")
+
+def post_slack_message(message, webhook_url=None):
+    webhook_url = webhook_url or SLACK_WEBHOOK_URL
+    if not webhook_url:
+        raise ValueError("SLACK_WEBHOOK_URL environment variable is not set")
 
     try:
         response = requests.post(
-            SLACK_WEBHOOK_URL,
+            webhook_url,
             data=json.dumps(message),
             headers={'Content-Type': 'application/json'},
             timeout=10
@@ -114,26 +557,174 @@ def send_slack_alert(down_nodes):
         print(f"Failed to send Slack notification: {e}", file=sys.stderr)
         return False
 
+def send_slack_alert(down_nodes):
+    message = {
+        "text": "🚨 *ACME Alert: Internal Nodes Down!*",
+        "attachments": [{
+            "color": "danger",
+            "text": f"The following nodes are unreachable from head node ({HEAD_NODE_IP}):\n" +
+                    ", ".join([f"`{n}`" for n in down_nodes])
+        }]
+    }
+    return post_slack_message(message)
+
+def send_slack_recovery(recovered_nodes):
+    message = {
+        "text": "✅ *ACME: Internal Nodes Recovered*",
+        "attachments": [{
+            "color": "good",
+            "text": f"The following nodes are reachable again from head node ({HEAD_NODE_IP}):\n" +
+                    ", ".join([f"`{n}`" for n in recovered_nodes])
+        }]
+    }
+    return post_slack_message(message)
+
+def send_slack_health(unhealthy):
+    """unhealthy is a list of (node_hostname, issues) pairs."""
+    message = {
+        "text": "⚠️ *ACME Alert: Unhealthy Internal Nodes*",
+        "attachments": [{
+            "color": "warning",
+            "text": "\n".join(f"`{n}`: {', '.join(issues)}" for n, issues in unhealthy)
+        }]
+    }
+    return post_slack_message(message)
+
 def verify_head_node_connection():
-    """Verify we can connect to the head node before checking all nodes."""
-    gateway = None
+    """
+    Verify we can connect to the head node before checking all nodes.
+    Returns tuple of (client, handshake_seconds); client is None on failure.
+    The open client is handed to the node checks so the run costs one handshake.
+    """
     try:
-        gateway = paramiko.SSHClient()
-        gateway.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        gateway.connect(
-            HEAD_NODE_IP,
-            username=HEAD_NODE_USER,
-            password=SSH_PASSWORD,
-            timeout=SSH_TIMEOUT
-        )
-        return True
+        return connect_head_node()
     except paramiko.AuthenticationException:
         print(f"ERROR: Authentication failed for {HEAD_NODE_USER}@{HEAD_NODE_IP}", file=sys.stderr)
         print("Make sure SSH keys are set up for passwordless access.", file=sys.stderr)
-        return False
+        return None, None
     except Exception as e:
         print(f"ERROR: Cannot connect to head node {HEAD_NODE_IP}: {e}", file=sys.stderr)
-        return False
+        return None, None
+
+
+def probe_nodes(gateway, nodes, batch=False, verbose=True):
+    """
+    Checks every node through the head node, either with one batch command
+    or with an adaptively sized thread pool of per-node pings.
+    Returns list of (node_hostname, is_up, error_message, rtt_ms, retries_used)
+    in the order of nodes
+    """
+    if batch:
+        return check_nodes_batch(gateway, nodes, verbose=verbose)
+
+    return probe_nodes_adaptive(functools.partial(check_node_via_jump, gateway=gateway), nodes)
+
+def adaptive_worker_count(remaining, avg_probe_time, time_left):
+    """Number of parallel probes needed to finish the remaining nodes within time_left."""
+    needed = math.ceil(remaining * avg_probe_time / max(time_left, 0.1))
+    return max(MIN_WORKERS, min(MAX_WORKERS_CAP, needed))
+
+def probe_nodes_adaptive(check, nodes, budget=SWEEP_BUDGET):
+    """
+    Runs check(node) for every node with a concurrency limit that is
+    recomputed after each completed probe from the observed mean probe
+    time and the time left in the sweep budget.
+    Returns list of check results in the order of nodes
+    """
+    results = {}
+    pending = collections.deque(nodes)
+    in_flight = {}
+    probe_times = []
+    limit = max(MIN_WORKERS, min(MAX_WORKERS_CAP, MAX_WORKERS))
+    sweep_start = time.monotonic()
+
+    def timed_check(node_hostname):
+        start = time.monotonic()
+        return check(node_hostname), time.monotonic() - start
+
+    # Using ThreadPoolExecutor because SSH is I/O bound; the pool is sized for
+    # the cap and the limit decides how many probes are submitted at once
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS_CAP) as executor:
+        while pending or in_flight:
+            while pending and len(in_flight) < limit:
+                node_hostname = pending.popleft()
+                in_flight[executor.submit(timed_check, node_hostname)] = node_hostname
+
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                node_hostname = in_flight.pop(future)
+                results[node_hostname], elapsed = future.result()
+                probe_times.append(elapsed)
+
+            time_left = budget - (time.monotonic() - sweep_start)
+            limit = adaptive_worker_count(len(pending), sum(probe_times) / len(probe_times), time_left)
+
+    return [results[n] for n in nodes]
+
+def watch_nodes(interval, batch=False, test=False, inventory="static"):
+    """
+    Probes the nodes every `interval` seconds over one long-lived head node
+    connection, reconnecting with exponential backoff when it drops.
+    Slack is only notified when a node goes down or comes back up.
+    The node inventory is re-resolved on every (re)connect.
+    """
+    gateway = None
+    backoff = 1
+    state = {}  # node -> is_up from the last completed sweep
+
+    print(f"Watching nodes via {HEAD_NODE_IP} every {interval}s (Ctrl-C to stop)...")
+    try:
+        while True:
+            if gateway is None:
+                try:
+                    load_adaptive_timeouts()
+                    gateway, handshake_time = connect_head_node()
+                    nodes = load_nodes(gateway, inventory)
+                    print(f"[{time.strftime('%H:%M:%S')}] Connected to head node in {handshake_time:.2f}s, "
+                          f"{len(nodes)} nodes")
+                    backoff = 1
+                except Exception as e:
+                    print(f"[{time.strftime('%H:%M:%S')}] Cannot connect to head node {HEAD_NODE_IP}: {e} "
+                          f"(retrying in {backoff}s)", file=sys.stderr)
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, RECONNECT_BACKOFF_MAX)
+                    continue
+
+            sweep_start = time.monotonic()
+            results = probe_nodes(gateway, nodes, batch=batch, verbose=False)
+
+            # A dropped connection makes every node look down; discard the
+            # sweep rather than alerting on it
+            transport = gateway.get_transport()
+            if transport is None or not transport.is_active():
+                print(f"[{time.strftime('%H:%M:%S')}] Head node connection lost, reconnecting...", file=sys.stderr)
+                gateway.close()
+                gateway = None
+                continue
+
+            record_history(results, handshake_time)
+
+            newly_down = [name for name, is_up, *_ in results if not is_up and state.get(name, True)]
+            recovered = [name for name, is_up, *_ in results if is_up and state.get(name) is False]
+            state = {name: is_up for name, is_up, *_ in results}
+
+            up_count = sum(state.values())
+            print(f"[{time.strftime('%H:%M:%S')}] {up_count} up, {len(state) - up_count} down "
+                  f"({time.monotonic() - sweep_start:.2f}s)")
+
+            for changed, label, send in ((newly_down, "down", send_slack_alert),
+                                         (recovered, "recovered", send_slack_recovery)):
+                if not changed:
+                    continue
+                print(f"  {label}: {', '.join(changed)}")
+                if test:
+                    print("  [TEST MODE] Slack alert would have been sent")
+                elif not send(changed):
+                    print("  Failed to send Slack alert.", file=sys.stderr)
+
+            time.sleep(max(0, interval - (time.monotonic() - sweep_start)))
+    except KeyboardInterrupt:
+        print("\nStopping watch.")
     finally:
         if gateway:
             gateway.close()
@@ -141,9 +732,34 @@ def verify_head_node_connection():
 
 def main():
     parser = argparse.ArgumentParser(description="Check ACME internal node health via head node")
+    parser.add_argument("command", nargs="?", choices=["check", "history"], default="check",
+                        help="check nodes (default) or report probe latency history")
+    parser.add_argument("--days", type=int, default=7,
+                        help="History window in days for the history command (default: 7)")
     parser.add_argument("--test", action="store_true", help="Print report to stdout instead of sending to Slack")
+    parser.add_argument("--no-reuse", action="store_true",
+                        help="Open a separate head node connection per node instead of sharing one")
+    parser.add_argument("--batch", action="store_true",
+                        help="Probe all nodes with a single parallel command on the head node")
+    parser.add_argument("--inventory", default="static", metavar="SOURCE",
+                        help="Node list source: static (node01-node20), slurm, hosts, or a local file path")
+    parser.add_argument("--deep", action="store_true",
+                        help="Also collect load, memory and disk usage from every up node")
+    parser.add_argument("--watch", type=float, metavar="INTERVAL",
+                        help="Keep running, probing every INTERVAL seconds and alerting only on state changes")
     args = parser.parse_args()
 
+    if args.no_reuse and (args.batch or args.watch or args.deep):
+        parser.error("--no-reuse cannot be combined with --batch, --watch or --deep")
+    if args.deep and args.watch:
+        parser.error("--deep is only available for one-shot checks")
+    if args.watch is not None and args.watch <= 0:
+        parser.error("--watch INTERVAL must be positive")
+
+    if args.command == "history":
+        print_history(args.days)
+        return
+
     # Validate required environment variables
     if not HEAD_NODE_IP:
         print("ERROR: HEAD_NODE_IP environment variable must be set", file=sys.stderr)
@@ -161,22 +777,51 @@ def main():
         print("ERROR: SSH_PASSWORD environment variable must be set", file=sys.stderr)
         sys.exit(1)
 
+    if args.watch:
+        watch_nodes(args.watch, batch=args.batch, test=args.test, inventory=args.inventory)
+        return
+
+    load_adaptive_timeouts()
+
     # Verify head node connection first
     print(f"Verifying connection to head node {HEAD_NODE_IP}...")
-    if not verify_head_node_connection():
+    gateway, handshake_time = verify_head_node_connection()
+    if gateway is None:
         sys.exit(1)
+    print(f"Connected in {handshake_time:.2f}s")
 
-    print(f"Starting check for {len(NODES)} nodes via {HEAD_NODE_IP}...")
+    nodes = load_nodes(gateway, args.inventory)
 
-    # Using ThreadPoolExecutor because SSH is I/O bound
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        results = list(executor.map(check_node_via_jump, NODES))
+    if args.no_reuse:
+        gateway.close()
+        gateway = None
 
-    down_nodes = [name for name, is_up, _ in results if not is_up]
-    up_nodes = [name for name, is_up, _ in results if is_up]
+    print(f"Starting check for {len(nodes)} nodes via {HEAD_NODE_IP}...")
+
+    probe_start = time.monotonic()
+    health = []
+    try:
+        results = probe_nodes(gateway, nodes, batch=args.batch)
+        probe_time = time.monotonic() - probe_start
+        record_history(results, handshake_time)
+
+        down_nodes = [name for name, is_up, *_ in results if not is_up]
+        up_nodes = [name for name, is_up, *_ in results if is_up]
+
+        if args.deep and up_nodes:
+            print(f"Collecting health metrics from {len(up_nodes)} nodes...")
+            deep_start = time.monotonic()
+            health = collect_node_health(gateway, up_nodes)
+            deep_time = time.monotonic() - deep_start
+    finally:
+        if gateway:
+            gateway.close()
 
     print(f"\n{'='*50}")
     print(f"Results: {len(up_nodes)} up, {len(down_nodes)} down")
+    print(f"Handshake: {handshake_time:.2f}s, probes: {probe_time:.2f}s")
+    if health:
+        print(f"Health metrics: {deep_time:.2f}s")
     print(f"{'='*50}")
 
     if up_nodes:
@@ -197,6 +842,27 @@ def main():
     else:
         print("\n✓ All internal nodes are reachable.")
 
+    unhealthy = []
+    if health:
+        print(f"\n  {'Node':<10} {'Load':>12} {'Mem':>5}  Disk")
+        for record in health:
+            if record["error"]:
+                print(f"  {record['node']:<10} {record['error']}")
+            else:
+                load = f"{record['load1']:.1f}/{record['cores']}"
+                disks = ", ".join(f"{m} {u:.0f}%" for m, u in record["disk_used_pct"].items())
+                print(f"  {record['node']:<10} {load:>12} {record['mem_used_pct']:>4.0f}%  {disks}")
+            issues = node_health_issues(record)
+            if issues:
+                unhealthy.append((record["node"], issues))
+
+    if unhealthy:
+        print(f"\n⚠ Unhealthy ({len(unhealthy)}): {', '.join(n for n, _ in unhealthy)}")
+        if args.test:
+            print("[TEST MODE] Slack health alert would have been sent")
+        elif not send_slack_health(unhealthy):
+            print("Failed to send Slack health alert.", file=sys.stderr)
+
 if __name__ == "__main__":
     main()
 
@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+"""
+Fleet Check
+Checks every lab machine in one parallel pass: hosts reached directly over
+SSH, jump hosts, and the nodes behind them. The fleet is described by an
+inventory file (see fleet.example.json); without one, it is built from the
+check_machines.py and check_acme.py environment variables.
+
+All checks share one pool of SSH connections (nodes are reached through
+direct-tcpip channels of their jump host's connection) and one thread pool,
+and the results are sent as a single combined report.
+
+Usage:
+    python check_fleet.py --test
+    python check_fleet.py --inventory fleet.json --workers 16
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import paramiko
+
+# Importing the checkers also loads .env and their configuration
+import check_acme
+import check_machines
+
+# --- CONFIGURATION ---
+INVENTORY_FILE = Path(__file__).parent / "fleet.json"
+SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_FLEET") or os.getenv("SLACK_WEBHOOK_UNIX")
+
+SSH_TIMEOUT = 10
+KEEPALIVE_INTERVAL = 15
+MAX_WORKERS = 12
+
+# --- INVENTORY ---
+
+def default_inventory():
+    """Returns the fleet described by MACHINES and HEAD_NODE_IP in the environment."""
+    inventory = {
+        "hosts": [
+            {"name": host, "user": check_machines.SSH_USERS.get(host, check_machines.SSH_USER)}
+            for host in check_machines.MACHINES
+        ],
+        "jump_hosts": [],
+    }
+    if check_acme.HEAD_NODE_IP:
+        inventory["jump_hosts"].append({
+            "name": "acme",
+            "host": check_acme.HEAD_NODE_IP,
+            "user": check_acme.HEAD_NODE_USER,
+            "nodes": check_acme.NODES,
+            "node_user": check_acme.NODE_USER,
+        })
+    return inventory
+
+def load_inventory(path=None):
+    """
+    Reads and validates an inventory file, or the default inventory if
+    path is None and fleet.json does not exist.
+    Returns tuple of (hosts, jump_hosts) lists of dicts with defaults filled in
+    """
+    if path is None and not INVENTORY_FILE.exists():
+        inventory = default_inventory()
+    else:
+        with open(path or INVENTORY_FILE) as f:
+            inventory = json.load(f)
+
+    def password(entry):
+        env_var = entry.get("password_env", "SSH_PASSWORD")
+        value = os.getenv(env_var)
+        if not value:
+            raise ValueError(f"{env_var} environment variable must be set for {entry['name']}")
+        return value
+
+    hosts = []
+    for entry in inventory.get("hosts", []):
+        if isinstance(entry, str):
+            entry = {"name": entry}
+        user = entry.get("user") or check_machines.SSH_USERS.get(entry["name"], check_machines.SSH_USER)
+        if not user:
+            raise ValueError(f"No SSH user for {entry['name']} (set \"user\" or SSH_USER)")
+        hosts.append({"name": entry["name"], "host": entry.get("host", entry["name"]),
+                      "user": user, "password": password(entry)})
+
+    jump_hosts = []
+    for entry in inventory.get("jump_hosts", []):
+        if "name" not in entry or not entry.get("user"):
+            raise ValueError(f"Jump host entries need a name and a user: {entry}")
+        nodes = entry.get("nodes", [])
+        if not isinstance(nodes, list):
+            raise ValueError(f"\"nodes\" of jump host {entry['name']} must be a list of hostnames")
+        jump_hosts.append({
+            "name": entry["name"],
+            "host": entry.get("host", entry["name"]),
+            "user": entry["user"],
+            "password": password(entry),
+            "nodes": nodes,
+            "node_user": entry.get("node_user", entry["user"]),
+            "node_metrics": entry.get("node_metrics", False),
+        })
+    return hosts, jump_hosts
+
+# --- CONNECTIONS ---
+
+class ConnectionPool:
+    """
+    Authenticated SSH connections shared by every check in a sweep, keyed by
+    (user, host). Connections to nodes behind a jump host are tunnelled
+    through a direct-tcpip channel of the jump host's connection.
+    """
+
+    def __init__(self):
+        self.clients = {}
+        self.lock = threading.Lock()
+        self.connect_locks = {}
+
+    def client(self, host, user, password, via=None):
+        key = (user, host)
+        with self.lock:
+            connect_lock = self.connect_locks.setdefault(key, threading.Lock())
+        # One handshake per key even if several checks ask for it at once
+        with connect_lock:
+            client = self.clients.get(key)
+            if client and client.get_transport() and client.get_transport().is_active():
+                return client
+
+            sock = None
+            if via is not None:
+                sock = via.get_transport().open_channel(
+                    "direct-tcpip", (host, check_machines.SSH_PORT), ("127.0.0.1", 0), timeout=SSH_TIMEOUT
+                )
+            client = check_machines.connect_host(host, user, password, sock=sock)
+            client.get_transport().set_keepalive(KEEPALIVE_INTERVAL)
+            self.clients[key] = client
+            return client
+
+    def close_all(self):
+        with self.lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients.clear()
+
+class PooledSession:
+    """Session over a pooled connection; closing it leaves the connection open."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def run(self, command, timeout=SSH_TIMEOUT):
+        _, stdout, _ = self.client.exec_command(command, timeout=timeout)
+        return stdout.read().decode("utf-8", errors="replace")
+
+    def close(self):
+        pass
+
+# --- CHECKS ---
+# Each check returns (entries, follow_ups): a list of report entry dicts and
+# a list of further checks to schedule on the same pool
+
+def entry(name, kind, status_text, severity, metrics=None, via=None, up=False):
+    """up marks nodes confirmed up by their jump host's ping."""
+    return {"name": name, "kind": kind, "via": via, "status": status_text,
+            "severity": severity, "metrics": metrics, "up": up}
+
+def machine_status(client, name):
+    """Runs the check_machines.py metrics check over a pooled connection."""
+    try:
+        return check_machines.session_status(name, PooledSession(client))
+    except paramiko.SSHException as e:
+        return f"⚪ SSH ERROR: {str(e)}", "Warning", None
+    except (ValueError, IndexError, KeyError) as e:
+        return f"⚪ PARSE ERROR: {str(e)}", "Warning", None
+    except Exception as e:
+        return f"⚪ ERROR: {str(e)}", "Warning", None
+
+def connect_error(e):
+    if isinstance(e, paramiko.AuthenticationException):
+        return "⚪ SSH ERROR: Authentication failed"
+    return f"⚪ SSH ERROR: {str(e)}"
+
+def check_host(pool, host):
+    try:
+        client = pool.client(host["host"], host["user"], host["password"])
+    except Exception as e:
+        return [entry(host["name"], "host", connect_error(e), "Warning")], []
+    return [entry(host["name"], "host", *machine_status(client, host["name"]))], []
+
+def check_jump_host(pool, jump):
+    """
+    Checks the jump host itself, then pings all its nodes with one batch
+    command on it. With node_metrics, up nodes get a metrics check each,
+    scheduled as follow-ups over tunnelled connections.
+    """
+    name = jump["name"]
+    try:
+        gateway = pool.client(jump["host"], jump["user"], jump["password"])
+    except Exception as e:
+        entries = [entry(name, "jump", connect_error(e), "Critical")]
+        entries += [entry(node, "node", "⚪ UNKNOWN (jump host unreachable)", "Warning", via=name)
+                    for node in jump["nodes"]]
+        return entries, []
+
+    entries = [entry(name, "jump", *machine_status(gateway, name))]
+    follow_ups = []
+    if not jump["nodes"]:
+        return entries, follow_ups
+
+    results = check_acme.check_nodes_batch(gateway, jump["nodes"], verbose=False, via=jump["host"])
+    for node, is_up, error, rtt_ms, retries in results:
+        if not is_up:
+            entries.append(entry(node, "node", f"🔴 DOWN{f' ({error})' if error else ''}", "Critical", via=name))
+        elif jump["node_metrics"]:
+            follow_ups.append(lambda node=node: check_node(pool, jump, gateway, node))
+        else:
+            rtt_str = f" ({rtt_ms:.1f} ms)" if rtt_ms is not None else ""
+            entries.append(entry(node, "node", f"🟢 UP{rtt_str}", "OK", via=name, up=True))
+    return entries, follow_ups
+
+def check_node(pool, jump, gateway, node):
+    """Metrics check of a node that already answered its jump host's ping."""
+    try:
+        client = pool.client(node, jump["node_user"], jump["password"], via=gateway)
+    except Exception as e:
+        return [entry(node, "node", connect_error(e), "Warning", via=jump["name"], up=True)], []
+    return [entry(node, "node", *machine_status(client, node), via=jump["name"], up=True)], []
+
+def run_checks(checks, workers=MAX_WORKERS):
+    """
+    Runs every check on one thread pool; follow-up checks are submitted to
+    the same pool as soon as the check that produced them finishes.
+    Returns list of all report entries
+    """
+    entries = []
+    # Using ThreadPoolExecutor because SSH is I/O bound
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(check) for check in checks}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                new_entries, follow_ups = future.result()
+                entries.extend(new_entries)
+                pending |= {executor.submit(check) for check in follow_ups}
+    return entries
+
+def check_fleet(hosts, jump_hosts, workers=MAX_WORKERS, probe=check_machines.PROBE_METHOD):
+    """
+    Probes reachability of all directly reached machines in one pass, then
+    checks the reachable ones and the nodes behind jump hosts on one pool.
+    Returns list of report entries in inventory order (nodes after their jump host)
+    """
+    pool = ConnectionPool()
+    check_machines.STATIC_CACHE.update(check_machines.load_static_cache())
+    check_machines.LATENCY.update(check_machines.load_latency())
+
+    # Probe and connect timeouts adapt to each machine's latency history
+    addresses = [m["host"] for m in hosts + jump_hosts]
+    rtts = check_machines.probe_hosts(addresses, probe, {
+        address: check_machines.host_timeout(address, "probe", check_machines.PING_TIMEOUT,
+                                             check_machines.PROBE_TIMEOUT_LIMITS)
+        for address in addresses
+    })
+    for address, rtt in rtts.items():
+        if rtt is not None:
+            check_machines.record_latency(address, "probe", rtt / 1000)
+
+    entries = []
+    checks = []
+    for host in hosts:
+        if rtts[host["host"]] is None:
+            entries.append(entry(host["name"], "host", "🔴 OFFLINE", "Critical"))
+        else:
+            checks.append(lambda host=host: check_host(pool, host))
+    for jump in jump_hosts:
+        if rtts[jump["host"]] is None:
+            entries.append(entry(jump["name"], "jump", "🔴 OFFLINE", "Critical"))
+            entries += [entry(node, "node", "⚪ UNKNOWN (jump host offline)", "Warning", via=jump["name"])
+                        for node in jump["nodes"]]
+        else:
+            checks.append(lambda jump=jump: check_jump_host(pool, jump))
+
+    try:
+        entries += run_checks(checks, workers)
+    finally:
+        pool.close_all()
+        check_machines.save_static_cache(check_machines.STATIC_CACHE)
+        check_machines.save_latency(check_machines.LATENCY)
+
+    order = {}
+    for host in hosts:
+        order[(host["name"], None)] = len(order)
+    for jump in jump_hosts:
+        order[(jump["name"], None)] = len(order)
+        for node in jump["nodes"]:
+            order[(node, jump["name"])] = len(order)
+    return sorted(entries, key=lambda e: order[(e["name"], e["via"])])
+
+# --- REPORT ---
+
+def format_report(entries):
+    """
+    Returns the report lines: one per host and jump host, with each jump
+    host's node summary below it and only the unhealthy nodes listed.
+    """
+    lines = []
+    nodes = {}
+    for e in entries:
+        if e["kind"] == "node":
+            nodes.setdefault(e["via"], []).append(e)
+
+    for e in entries:
+        if e["kind"] == "node":
+            continue
+        label = f"*{e['name']}*" + (" (jump host)" if e["kind"] == "jump" else "")
+        lines.append(f"{label}: {e['status']}")
+        drilldown = check_machines.format_drilldown(e["metrics"]) if e["metrics"] else ""
+        if drilldown:
+            lines.append(f"    ↳ {drilldown}")
+
+        behind = nodes.get(e["name"], [])
+        if behind:
+            up = sum(1 for n in behind if n["up"])
+            lines.append(f"    {up}/{len(behind)} nodes up")
+            for n in behind:
+                if n["severity"] != "OK":
+                    lines.append(f"    • `{n['name']}`: {n['status']}")
+    return lines
+
+def send_slack_report(lines, machine_count):
+    message = {
+        "text": "Lab Fleet Health Report",
+        "blocks": [
+            {
+                "type": "header",
+                "text": {"type": "plain_text", "text": "📊 Lab Fleet Health Report"}
+            },
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": f"Checked {machine_count} machines:\n\n" + "\n".join(lines)}
+            }
+        ]
+    }
+    return check_acme.post_slack_message(message, SLACK_WEBHOOK_URL)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check direct hosts, jump hosts and the nodes behind them in one pass")
+    parser.add_argument("--inventory", metavar="FILE",
+                        help=f"Inventory file (default: {INVENTORY_FILE.name} if present, else the environment)")
+    parser.add_argument("--test", action="store_true", help="Print report to stdout instead of sending to Slack")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help=f"Number of checks run in parallel (default: {MAX_WORKERS})")
+    parser.add_argument("--probe", choices=["tcp", "icmp", "ping"], default=check_machines.PROBE_METHOD,
+                        help=f"Reachability probe for direct hosts and jump hosts (default: {check_machines.PROBE_METHOD})")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    try:
+        hosts, jump_hosts = load_inventory(args.inventory)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"ERROR: Invalid inventory: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not hosts and not jump_hosts:
+        print("ERROR: The inventory is empty (create fleet.json or set MACHINES / HEAD_NODE_IP)", file=sys.stderr)
+        sys.exit(1)
+
+    if not args.test and not SLACK_WEBHOOK_URL:
+        print("ERROR: SLACK_WEBHOOK_FLEET or SLACK_WEBHOOK_UNIX environment variable must be set", file=sys.stderr)
+        sys.exit(1)
+
+    machine_count = len(hosts) + sum(1 + len(j["nodes"]) for j in jump_hosts)
+    start = time.monotonic()
+    entries = check_fleet(hosts, jump_hosts, args.workers, args.probe)
+    check_machines.record_history([
+        (e["name"], e["status"], e["severity"], e["metrics"]) for e in entries if e["kind"] != "node"
+    ])
+    lines = format_report(entries)
+
+    if args.test:
+        print("\n".join(lines))
+        print(f"\nChecked {machine_count} machines in {time.monotonic() - start:.1f}s")
+    else:
+        success = send_slack_report(lines, machine_count)
+        if success:
+            print("Report sent to Slack successfully.")
+        else:
+            print("Failed to send report to Slack.", file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,20 @@ import sys
 import argparse
 import paramiko
 import os
+import re
+import time
+import errno
+import select
+import selectors
+import socket
+import struct
+import signal
+import socketserver
+import threading
+import fcntl
+import math
+import mmap
+import concurrent.futures
 from pathlib import Path
 
 # Load environment variables from .env file
@@ -40,71 +54,1045 @@ if os.getenv("SSH_USERS_MAP"):
 PING_TIMEOUT = 1
 SSH_TIMEOUT = 3
 
+# Adaptive timeouts: a host's probe and SSH connect timeouts are
+# TIMEOUT_FACTOR x the TIMEOUT_PERCENTILE of its last LATENCY_SAMPLES
+# measurements (kept in LATENCY_FILE), clamped to the limits below. Hosts
+# with fewer than LATENCY_MIN_SAMPLES measurements use the fixed timeouts.
+LATENCY_FILE = Path(__file__).parent / ".machines_latency.json"
+LATENCY_SAMPLES = 50
+LATENCY_MIN_SAMPLES = 5
+TIMEOUT_PERCENTILE = 95
+TIMEOUT_FACTOR = 3.0
+PROBE_TIMEOUT_LIMITS = (0.2, 5.0)
+CONNECT_TIMEOUT_LIMITS = (1.0, 15.0)
+LATENCY = {}  # host -> {"probe": [seconds, ...], "connect": [seconds, ...]}
+
+# Parallel checks: hosts are checked concurrently by MAX_WORKERS threads; a
+# host still running after HOST_DEADLINE seconds is reported as timed out
+MAX_WORKERS = 8
+HOST_DEADLINE = 30
+
+# Health thresholds applied to the metrics collected over SSH
+LOAD_THRESHOLD = 1.0         # 1-minute load per core
+MEM_USED_THRESHOLD = 90.0    # percent of MemTotal not available
+SWAP_USED_THRESHOLD = 50.0   # percent of swap in use
+IOWAIT_THRESHOLD = 20.0      # percent of CPU time waiting on I/O
+DISK_USED_THRESHOLD = 90.0   # percent of filesystem used
+DISK_PATHS = ["/", "/home", "/tmp"]
+STAT_SAMPLE_INTERVAL = 0.5   # seconds between the two /proc/stat samples
+
+# Drill-down: when a host is over the load or memory threshold, the top
+# processes by CPU and by memory are captured over the same SSH session,
+# summarised in the report and saved under SNAPSHOT_DIR (last SNAPSHOT_KEEP per host)
+DRILLDOWN_TOP = 5
+DRILLDOWN_SUMMARY = 3
+SNAPSHOT_DIR = Path(__file__).parent / ".machines_snapshots"
+SNAPSHOT_KEEP = 50
+
+# Static host facts (core count, total memory) are cached locally and only
+# re-read from the host once the cache entry is older than the TTL
+STATIC_CACHE_FILE = Path(__file__).parent / ".machines_static.json"
+STATIC_CACHE_TTL = 7 * 24 * 3600
+STATIC_CACHE = {}
+
+# Session agent ("agent" command): a long-running local process that keeps
+# authenticated SSH sessions to every configured host and runs commands for
+# the checker over a Unix socket, so checks skip the SSH handshake. Checks
+# use it automatically while the socket exists (disable with --no-agent).
+AGENT_SOCKET = Path(__file__).parent / ".machines_agent.sock"
+AGENT_KEEPALIVE = 30
+AGENT_IDLE_TIMEOUT = 1800
+
+# Load history ("report" command): one fixed-size, memory-mapped round-robin
+# file per host. Every check writes its sample into a slot of each archive;
+# coarser archives keep running sum/min/max per slot, so old periods are
+# consolidated without a separate pass. (resolution seconds, slots)
+HISTORY_DIR = Path(__file__).parent / ".machines_history"
+HISTORY_METRICS = ["load_pct", "cpu_busy_pct", "mem_used_pct", "iowait_pct"]
+HISTORY_ARCHIVES = [
+    (300, 2016),      # 5-minute samples for 7 days
+    (3600, 840),      # hourly for 35 days
+    (86400, 400),     # daily for ~13 months
+]
+REPORT_WINDOWS = [("day", 86400), ("week", 7 * 86400), ("month", 30 * 86400)]
+
+# Machine selection ("pick" command / pick_machines): the latest metrics of
+# every sweep are cached and reused for PICK_CACHE_TTL seconds, so a burst of
+# job submissions shares one sweep
+PICK_CACHE_FILE = Path(__file__).parent / ".machines_pick.json"
+PICK_CACHE_TTL = 120
+
+# Reachability probe (--probe): "tcp" connects to the SSH port, "icmp" sends
+# echo requests from a socket (needs unprivileged ICMP sockets or root, falls
+# back to tcp otherwise), "ping" runs the /sbin/ping subprocess per host.
+PROBE_METHOD = "tcp"
+SSH_PORT = 22
+
+# Wake-on-LAN: hosts that don't answer the first probe are sent a magic
+# packet (if their MAC is in WOL_MACS, format "host=aa:bb:cc:dd:ee:ff,...")
+# and re-probed every WOL_REPROBE_INTERVAL seconds in the background while
+# the rest of the sweep continues. They are reported offline once
+# WOL_WAKE_DEADLINE passes (WOL_RETRY_TIMEOUT for hosts without a MAC).
+WOL_MACS = {}
+if os.getenv("WOL_MACS"):
+    for entry in os.getenv("WOL_MACS").split(","):
+        entry = entry.strip()
+        if "=" in entry:
+            host, mac = entry.split("=", 1)
+            WOL_MACS[host.strip()] = mac.strip()
+WOL_BROADCAST = os.getenv("WOL_BROADCAST", "255.255.255.255")
+WOL_PORT = 9
+WOL_RETRY_TIMEOUT = 10
+WOL_WAKE_DEADLINE = 90
+WOL_REPROBE_INTERVAL = 2
+
 # ---------------------
 
-def get_node_status(host):
-    # Ping check
+def host_timeouts(hosts, timeout):
+    """Returns dict of host -> timeout for a single timeout or a per-host dict."""
+    if isinstance(timeout, dict):
+        return {host: timeout.get(host, PING_TIMEOUT) for host in hosts}
+    return {host: timeout for host in hosts}
+
+def probe_tcp(hosts, timeout=PING_TIMEOUT, port=SSH_PORT):
+    """
+    Checks reachability of all hosts at once with non-blocking TCP connects
+    to the SSH port. A refused connection still counts as reachable.
+    timeout is in seconds, either for all hosts or a dict per host.
+    Returns dict of host -> RTT in ms, or None if unreachable
+    """
+    timeouts = host_timeouts(hosts, timeout)
+    results = {host: None for host in hosts}
+    sel = selectors.DefaultSelector()
+    for host in hosts:
+        try:
+            family, type_, proto, _, addr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        except socket.gaierror:
+            continue
+        sock = socket.socket(family, type_, proto)
+        sock.setblocking(False)
+        start = time.monotonic()
+        err = sock.connect_ex(addr)
+        if err in (0, errno.ECONNREFUSED):
+            results[host] = (time.monotonic() - start) * 1000
+            sock.close()
+        elif err in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+            sel.register(sock, selectors.EVENT_WRITE, (host, start, start + timeouts[host]))
+        else:
+            sock.close()
+
+    try:
+        while sel.get_map():
+            now = time.monotonic()
+            for key in list(sel.get_map().values()):
+                if now >= key.data[2]:
+                    sel.unregister(key.fileobj)
+                    key.fileobj.close()
+            if not sel.get_map():
+                break
+            remaining = min(key.data[2] for key in sel.get_map().values()) - now
+            for key, _ in sel.select(timeout=remaining):
+                host, start, _ = key.data
+                err = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err in (0, errno.ECONNREFUSED):
+                    results[host] = (time.monotonic() - start) * 1000
+                sel.unregister(key.fileobj)
+                key.fileobj.close()
+    finally:
+        for key in list(sel.get_map().values()):
+            key.fileobj.close()
+        sel.close()
+    return results
+
+def icmp_checksum(data):
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+def open_icmp_socket():
+    """Returns an ICMP socket (unprivileged datagram if allowed, else raw), or None."""
+    for kind in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        try:
+            return socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP)
+        except OSError:
+            continue
+    return None
+
+def probe_icmp(hosts, timeout=PING_TIMEOUT, interval=1.0):
+    """
+    Checks reachability of all hosts at once with ICMP echo requests from a
+    single socket, re-sending every `interval` seconds until `timeout`
+    (in seconds, either for all hosts or a dict per host).
+    Returns dict of host -> RTT in ms, or None if unreachable
+    Raises PermissionError if no ICMP socket can be opened
+    """
+    sock = open_icmp_socket()
+    if sock is None:
+        raise PermissionError("ICMP sockets not permitted")
+
+    timeouts = host_timeouts(hosts, timeout)
+    results = {host: None for host in hosts}
+    waiting = {}  # IPv4 address -> hosts resolving to it
+    for host in hosts:
+        try:
+            waiting.setdefault(socket.gethostbyname(host), []).append(host)
+        except socket.gaierror:
+            continue
+
+    # Datagram ICMP sockets get their identifier rewritten by the kernel
+    ident = os.getpid() & 0xffff
+    check_ident = sock.type == socket.SOCK_RAW
+    sent = {}
+    seq = 0
+    now = time.monotonic()
+    deadlines = {addr: now + max(timeouts[h] for h in addr_hosts) for addr, addr_hosts in waiting.items()}
+    next_send = now
+    try:
+        while waiting:
+            for addr in [a for a in waiting if now >= deadlines[a]]:
+                del waiting[addr]
+            if not waiting:
+                break
+            deadline = min(deadlines[a] for a in waiting)
+            if now >= next_send:
+                seq += 1
+                header = struct.pack("!BBHHH", 8, 0, 0, ident, seq)
+                packet = struct.pack("!BBHHH", 8, 0, icmp_checksum(header), ident, seq)
+                for addr in waiting:
+                    try:
+                        sock.sendto(packet, (addr, 0))
+                        sent[addr] = time.monotonic()
+                    except OSError:
+                        pass
+                next_send = now + interval
+
+            ready, _, _ = select.select([sock], [], [], max(0, min(deadline, next_send) - time.monotonic()))
+            now = time.monotonic()
+            if not ready:
+                continue
+            data, (addr, _) = sock.recvfrom(1024)
+            if data and data[0] >> 4 == 4:
+                # Raw sockets (and macOS datagram sockets) include the IP header
+                data = data[(data[0] & 0x0f) * 4:]
+            if len(data) < 8 or data[0] != 0 or addr not in waiting or addr not in sent:
+                continue
+            if check_ident and struct.unpack("!H", data[4:6])[0] != ident:
+                continue
+            for host in waiting.pop(addr):
+                results[host] = (now - sent[addr]) * 1000
+    finally:
+        sock.close()
+    return results
+
+def probe_ping(host, count=1, wait=PING_TIMEOUT):
+    """Runs the system ping for one host. Returns the RTT in ms (0.0 if not reported), or None if down."""
     ping = subprocess.run(
-        ["/sbin/ping", "-c", "1", "-W", str(PING_TIMEOUT), host],
+        ["/sbin/ping", "-c", str(count), "-W", str(wait), host],
         capture_output=True
     )
     if ping.returncode != 0:
-        # Retry with a longer window: hosts configured for wake-on-LAN
-        # may take a few seconds to come online after the first probe.
-        ping = subprocess.run(
-            ["/sbin/ping", "-c", "5", "-W", "2", host],
-            capture_output=True
-        )
-        if ping.returncode != 0:
-            return "🔴 OFFLINE", "Critical"
+        return None
+    match = re.search(rb"time[=<]([0-9.]+)", ping.stdout)
+    return float(match.group(1)) if match else 0.0
+
+def probe_hosts(hosts, method=PROBE_METHOD, timeout=PING_TIMEOUT):
+    """
+    Checks reachability of all hosts in one pass with the in-process tcp or
+    icmp probe, or with concurrent system pings for "ping". icmp falls back
+    to tcp when ICMP sockets are not permitted. timeout is in seconds,
+    either for all hosts or a dict per host.
+    Returns dict of host -> RTT in ms, or None if unreachable
+    """
+    if method == "ping":
+        timeouts = host_timeouts(hosts, timeout)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(hosts))) as executor:
+            return dict(zip(hosts, executor.map(lambda h: probe_ping(h, wait=math.ceil(timeouts[h])), hosts)))
+    if method == "icmp":
+        try:
+            return probe_icmp(hosts, timeout)
+        except PermissionError:
+            print("Warning: ICMP sockets not permitted, probing the SSH port instead", file=sys.stderr)
+    return probe_tcp(hosts, timeout)
+
+def send_wol(mac, broadcast=WOL_BROADCAST, port=WOL_PORT):
+    """Broadcasts a wake-on-LAN magic packet for the given MAC address."""
+    mac_bytes = bytes.fromhex(mac.replace(":", "").replace("-", ""))
+    if len(mac_bytes) != 6:
+        raise ValueError(f"Invalid MAC address: {mac}")
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.sendto(b"\xff" * 6 + mac_bytes * 16, (broadcast, port))
+
+def load_latency():
+    try:
+        with open(LATENCY_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-    # Load check via SSH
-    client = None
+def save_latency(latency):
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        with open(LATENCY_FILE, "w") as f:
+            json.dump(latency, f)
+    except OSError as e:
+        print(f"Warning: cannot write {LATENCY_FILE}: {e}", file=sys.stderr)
 
-        # Get the appropriate username for this host
-        username = SSH_USERS.get(host, SSH_USER)
+def record_latency(host, kind, seconds):
+    """Adds a "probe" or "connect" latency sample for host, keeping the last LATENCY_SAMPLES."""
+    samples = LATENCY.setdefault(host, {}).setdefault(kind, [])
+    samples.append(round(seconds, 4))
+    del samples[:-LATENCY_SAMPLES]
 
-        client.connect(
-            host,
-            username=username,
-            password=SSH_PASSWORD,
-            timeout=SSH_TIMEOUT
-        )
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def adaptive_timeout(samples, default, limits, min_samples=LATENCY_MIN_SAMPLES):
+    """
+    TIMEOUT_FACTOR x the TIMEOUT_PERCENTILE of samples (seconds), clamped
+    to limits, or default with fewer than min_samples samples.
+    """
+    if len(samples) < min_samples:
+        return default
+    low, high = limits
+    return min(high, max(low, percentile(samples, TIMEOUT_PERCENTILE) * TIMEOUT_FACTOR))
+
+def host_timeout(host, kind, default, limits):
+    """Returns host's timeout in seconds from its "probe" or "connect" latency history."""
+    return adaptive_timeout(LATENCY.get(host, {}).get(kind, []), default, limits)
 
-        stdin, stdout, stderr = client.exec_command("nproc; uptime")
-        lines = stdout.read().decode('utf-8').strip().splitlines()
+def load_static_cache():
+    try:
+        with open(STATIC_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    now = time.time()
+    return {h: v for h, v in cache.items() if now - v.get("updated", 0) < STATIC_CACHE_TTL}
+
+def save_static_cache(cache):
+    try:
+        with open(STATIC_CACHE_FILE, "w") as f:
+            json.dump(cache, f, indent=1)
+    except OSError as e:
+        print(f"Warning: cannot write {STATIC_CACHE_FILE}: {e}", file=sys.stderr)
+
+def metrics_command(static=None):
+    """
+    Builds the single shell command that collects all host metrics.
+    Sections are separated by "@@" lines; the static facts (nproc and
+    MemTotal) are not fetched when cached facts are available.
+    """
+    disk_paths = " ".join(DISK_PATHS)
+    mem_fields = "MemAvailable|SwapTotal|SwapFree" if static else "MemTotal|MemAvailable|SwapTotal|SwapFree"
+    command = (
+        "cat /proc/loadavg; echo @@; "
+        f"grep -E '^({mem_fields}):' /proc/meminfo; echo @@; "
+        f"grep -E '^(cpu |procs_blocked)' /proc/stat; sleep {STAT_SAMPLE_INTERVAL}; grep '^cpu ' /proc/stat; echo @@; "
+        f"df -P -k {disk_paths} 2>/dev/null"
+    )
+    if static is None:
+        command += "; echo @@; nproc"
+    return command
 
-        if len(lines) < 2:
-            return "⚪ SSH ERROR: Invalid output", "Warning"
+def parse_host_metrics(output, static=None):
+    """
+    Parses the output of metrics_command into a per-host record dict:
+    load1/load5/load15, cores, mem_total_kb, mem_used_pct, swap_used_pct,
+    cpu_busy_pct, iowait_pct, procs_blocked and disk_used_pct (mount -> %).
+    """
+    sections = [sec.strip().splitlines() for sec in re.split(r"^@@$", output, flags=re.M)]
+    loadavg, meminfo_lines, stat_lines, df_lines = sections[:4]
 
-        nproc = int(lines[0].strip())
-        load_line = lines[-1]
+    load1, load5, load15 = (float(x) for x in loadavg[0].split()[:3])
 
-        # Parse load average more defensively
-        if "load average:" not in load_line:
-            return "⚪ SSH ERROR: Cannot parse load", "Warning"
+    meminfo = {}
+    for line in meminfo_lines:
+        key, value = line.split(":", 1)
+        meminfo[key] = int(value.split()[0])
 
-        load_str = load_line.split("load average:")[1].split(",")[0].strip()
-        load_val = float(load_str)
+    cpu_samples = []
+    procs_blocked = 0
+    for line in stat_lines:
+        parts = line.split()
+        if parts[0] == "cpu":
+            cpu_samples.append([int(x) for x in parts[1:]])
+        elif parts[0] == "procs_blocked":
+            procs_blocked = int(parts[1])
+    # Fields: user nice system idle iowait irq softirq steal ...
+    delta = [b - a for a, b in zip(cpu_samples[0], cpu_samples[-1])]
+    total = sum(delta[:8]) or 1
+    cpu_busy_pct = 100.0 * (total - delta[3] - delta[4]) / total
+    iowait_pct = 100.0 * delta[4] / total
+
+    disks = {}
+    for line in df_lines[1:]:
+        parts = line.split()
+        if len(parts) >= 6 and parts[4].endswith("%"):
+            disks[parts[5]] = float(parts[4][:-1])
+
+    if static is None:
+        static = {"cores": int(sections[4][0]), "mem_total_kb": meminfo["MemTotal"]}
+    mem_total = static["mem_total_kb"]
+    swap_total = meminfo.get("SwapTotal", 0)
+
+    return {
+        "load1": load1,
+        "load5": load5,
+        "load15": load15,
+        "cores": static["cores"],
+        "mem_total_kb": mem_total,
+        "mem_used_pct": 100.0 * (mem_total - meminfo["MemAvailable"]) / mem_total,
+        "swap_used_pct": 100.0 * (swap_total - meminfo.get("SwapFree", 0)) / swap_total if swap_total else 0.0,
+        "cpu_busy_pct": cpu_busy_pct,
+        "iowait_pct": iowait_pct,
+        "procs_blocked": procs_blocked,
+        "disk_used_pct": disks,
+    }
+
+def host_health(metrics):
+    """Classifies a metrics record. Returns (status_text, severity)."""
+    load_str = f"{metrics['load1']:.2f}"
+    labels = []
+    details = [load_str]
+    if metrics["load1"] > LOAD_THRESHOLD * metrics["cores"]:
+        labels.append("HIGH LOAD")
+    if metrics["mem_used_pct"] > MEM_USED_THRESHOLD or metrics["swap_used_pct"] > SWAP_USED_THRESHOLD:
+        labels.append("HIGH MEMORY")
+        details.append(f"mem {metrics['mem_used_pct']:.0f}%, swap {metrics['swap_used_pct']:.0f}%")
+    if metrics["iowait_pct"] > IOWAIT_THRESHOLD:
+        labels.append("HIGH I/O WAIT")
+        details.append(f"iowait {metrics['iowait_pct']:.0f}%, {metrics['procs_blocked']} blocked")
+    full = [f"{m} {u:.0f}%" for m, u in metrics["disk_used_pct"].items() if u > DISK_USED_THRESHOLD]
+    if full:
+        labels.append("DISK FULL")
+        details.extend(full)
+
+    if labels:
+        return f"🟡 {' + '.join(labels)} ({', '.join(details)})", "Warning"
+    return f"🟢 HEALTHY ({load_str})", "OK"
+
+def drilldown_command(top=DRILLDOWN_TOP):
+    ps = "ps -eo user:16,pid,pcpu,pmem,etime,comm --no-headers"
+    return f"{ps} --sort=-pcpu | head -n {top}; echo @@; {ps} --sort=-pmem | head -n {top}"
+
+def parse_drilldown(output):
+    """
+    Parses drilldown_command output.
+    Returns (top_cpu, top_mem), lists of {user, pid, cpu_pct, mem_pct, elapsed, command}
+    """
+    tables = []
+    for section in re.split(r"^@@$", output, flags=re.M)[:2]:
+        processes = []
+        for line in section.strip().splitlines():
+            parts = line.split(None, 5)
+            if len(parts) < 6:
+                continue
+            user, pid, cpu, mem, elapsed, command = parts
+            processes.append({"user": user, "pid": int(pid), "cpu_pct": float(cpu),
+                              "mem_pct": float(mem), "elapsed": elapsed, "command": command})
+        tables.append(processes)
+    while len(tables) < 2:
+        tables.append([])
+    return tables[0], tables[1]
+
+def needs_drilldown(metrics):
+    return (metrics["load1"] > LOAD_THRESHOLD * metrics["cores"] or
+            metrics["mem_used_pct"] > MEM_USED_THRESHOLD)
+
+def format_drilldown(metrics, top=DRILLDOWN_SUMMARY):
+    """Compact one-line summary of the top processes for the Slack report, or ''."""
+    parts = []
+    if metrics.get("top_cpu") and metrics["load1"] > LOAD_THRESHOLD * metrics["cores"]:
+        parts.append("CPU: " + "; ".join(
+            f"`{p['user']}` {p['command']} {p['cpu_pct']:.0f}% ({p['elapsed']})" for p in metrics["top_cpu"][:top]
+        ))
+    if metrics.get("top_mem") and metrics["mem_used_pct"] > MEM_USED_THRESHOLD:
+        parts.append("Mem: " + "; ".join(
+            f"`{p['user']}` {p['command']} {p['mem_pct']:.0f}% ({p['elapsed']})" for p in metrics["top_mem"][:top]
+        ))
+    return " | ".join(parts)
+
+def save_snapshot(host, metrics):
+    """Saves a drill-down snapshot in the host's own directory and keeps only its latest SNAPSHOT_KEEP."""
+    try:
+        host_dir = SNAPSHOT_DIR / host
+        host_dir.mkdir(parents=True, exist_ok=True)
+        path = host_dir / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+        with open(path, "w") as f:
+            json.dump(dict(metrics, host=host, time=time.time()), f, indent=1)
+        for old in sorted(host_dir.glob("*.json"))[:-SNAPSHOT_KEEP]:
+            old.unlink()
+    except OSError as e:
+        print(f"Warning: cannot save snapshot for {host}: {e}", file=sys.stderr)
 
-        if load_val > nproc:
-            return f"🟡 HIGH LOAD ({load_str})", "Warning"
-        return f"🟢 HEALTHY ({load_str})", "OK"
+def connect_host(host, username=None, password=None, sock=None):
+    """
+    Opens an authenticated SSH connection to host (by default with its
+    mapped username and SSH_PASSWORD), using the host's adaptive connect
+    timeout, and records the connect time. sock is an optional open channel
+    to connect through, e.g. a direct-tcpip channel of a jump host.
+    """
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
+    # Get the appropriate username for this host
+    username = username or SSH_USERS.get(host, SSH_USER)
+
+    start = time.monotonic()
+    client.connect(
+        host,
+        port=SSH_PORT,
+        username=username,
+        password=password or SSH_PASSWORD,
+        sock=sock,
+        timeout=host_timeout(host, "connect", SSH_TIMEOUT, CONNECT_TIMEOUT_LIMITS)
+    )
+    record_latency(host, "connect", time.monotonic() - start)
+    return client
+
+class DirectSession:
+    """Runs commands on one host over its own SSH connection."""
+
+    def __init__(self, host):
+        self.client = connect_host(host)
+
+    def run(self, command, timeout=SSH_TIMEOUT):
+        stdin, stdout, stderr = self.client.exec_command(command, timeout=timeout)
+        return stdout.read().decode('utf-8')
+
+    def close(self):
+        self.client.close()
+
+class AgentSession:
+    """Runs commands on one host through the local session agent."""
+
+    def __init__(self, host):
+        self.host = host
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.settimeout(SSH_TIMEOUT)
+            self.sock.connect(str(AGENT_SOCKET))
+        except OSError:
+            self.sock.close()
+            raise
+        self.file = self.sock.makefile("rwb")
+
+    def run(self, command, timeout=SSH_TIMEOUT):
+        request = {"host": self.host, "command": command, "timeout": timeout}
+        self.file.write(json.dumps(request).encode() + b"\n")
+        self.file.flush()
+        # The agent may have to reconnect an evicted session first
+        self.sock.settimeout(timeout + SSH_TIMEOUT)
+        line = self.file.readline()
+        if not line:
+            raise paramiko.SSHException("Session agent closed the connection")
+        reply = json.loads(line)
+        if not reply["ok"]:
+            if reply.get("auth"):
+                raise paramiko.AuthenticationException(reply["error"])
+            raise paramiko.SSHException(reply["error"])
+        return reply["stdout"]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+def open_session(host, use_agent=True):
+    """
+    Returns a session for running commands on host: through the session
+    agent if it is running, otherwise over a new SSH connection.
+    """
+    if use_agent and AGENT_SOCKET.exists():
+        try:
+            return AgentSession(host)
+        except OSError:
+            pass
+    return DirectSession(host)
+
+def get_node_status(host, reachable=None, use_agent=True):
+    """
+    Checks one host and returns (status_text, severity, metrics); metrics
+    is the parse_host_metrics record, or None if the host was not measured.
+    reachable is the result of an earlier probe_hosts pass; if None, the
+    host is probed once with PROBE_METHOD first (sleeping hosts are woken
+    and re-probed by check_all_hosts, not here). Commands go through the
+    session agent when use_agent is set and the agent is running.
+    """
+    if reachable is None:
+        timeout = host_timeout(host, "probe", PING_TIMEOUT, PROBE_TIMEOUT_LIMITS)
+        reachable = probe_hosts([host], PROBE_METHOD, timeout)[host] is not None
+    if not reachable:
+        return "🔴 OFFLINE", "Critical", None
+
+    # Metrics check via SSH
+    session = None
+    try:
+        session = open_session(host, use_agent)
+        return session_status(host, session)
     except paramiko.AuthenticationException:
-        return "⚪ SSH ERROR: Authentication failed", "Warning"
+        return "⚪ SSH ERROR: Authentication failed", "Warning", None
     except paramiko.SSHException as e:
-        return f"⚪ SSH ERROR: {str(e)}", "Warning"
-    except (ValueError, IndexError) as e:
-        return f"⚪ PARSE ERROR: {str(e)}", "Warning"
+        return f"⚪ SSH ERROR: {str(e)}", "Warning", None
+    except (ValueError, IndexError, KeyError) as e:
+        return f"⚪ PARSE ERROR: {str(e)}", "Warning", None
     except Exception as e:
-        return f"⚪ ERROR: {str(e)}", "Warning"
+        return f"⚪ ERROR: {str(e)}", "Warning", None
+    finally:
+        if session:
+            session.close()
+
+def session_status(host, session):
+    """
+    Collects metrics for host over an open session (anything with a
+    run(command, timeout) method) and returns (status_text, severity, metrics).
+    SSH and parse errors are left to the caller.
+    """
+    # One round trip for all metrics; static facts come from the cache if known
+    static = STATIC_CACHE.get(host)
+    output = session.run(metrics_command(static), timeout=SSH_TIMEOUT + STAT_SAMPLE_INTERVAL)
+    if output.count("@@") < 3:
+        return "⚪ SSH ERROR: Invalid output", "Warning", None
+
+    metrics = parse_host_metrics(output, static)
+    if static is None:
+        STATIC_CACHE[host] = {
+            "cores": metrics["cores"],
+            "mem_total_kb": metrics["mem_total_kb"],
+            "updated": time.time(),
+        }
+
+    # Capture the culprits while the session is still open
+    if needs_drilldown(metrics):
+        try:
+            metrics["top_cpu"], metrics["top_mem"] = parse_drilldown(
+                session.run(drilldown_command(), timeout=SSH_TIMEOUT)
+            )
+            save_snapshot(host, metrics)
+        except Exception as e:
+            print(f"Warning: drill-down on {host} failed: {e}", file=sys.stderr)
+
+    status_text, severity = host_health(metrics)
+    return status_text, severity, metrics
+
+def check_all_hosts(hosts, workers=MAX_WORKERS, deadline=HOST_DEADLINE, probe=PROBE_METHOD, use_agent=True,
+                    wake=True):
+    """
+    Checks reachability of all hosts in one pass, then runs get_node_status
+    for the reachable ones concurrently. Hosts that don't answer are sent a
+    wake-on-LAN packet and re-probed in the background until their wake
+    deadline, so they don't hold up the rest of the sweep; hosts that come
+    up are checked and marked as woken on request. With wake=False, hosts
+    that don't answer are reported offline straight away.
+    A host whose check has been running for longer than `deadline` seconds
+    is reported as timed out without waiting for it.
+    Returns list of (host, status_text, severity, metrics) in the order of hosts
+    """
+    results = {}
+    started = {}
+    woken = set()  # hosts sent a wake-on-LAN packet
+    woke = set()   # of those, hosts that came up
+    STATIC_CACHE.update(load_static_cache())
+    LATENCY.update(load_latency())
+
+    # Each host gets its own probe timeout from its latency history
+    rtts = probe_hosts(hosts, probe, {
+        host: host_timeout(host, "probe", PING_TIMEOUT, PROBE_TIMEOUT_LIMITS) for host in hosts
+    })
+    for host, rtt in rtts.items():
+        if rtt is not None:
+            record_latency(host, "probe", rtt / 1000)
+    asleep = {}  # host -> monotonic time after which it is reported offline
+    for host in hosts:
+        if rtts[host] is not None:
+            continue
+        if not wake:
+            results[host] = ("🔴 OFFLINE", "Critical", None)
+            continue
+        wake_deadline = WOL_RETRY_TIMEOUT
+        if host in WOL_MACS:
+            try:
+                send_wol(WOL_MACS[host])
+                woken.add(host)
+                wake_deadline = WOL_WAKE_DEADLINE
+            except (OSError, ValueError) as e:
+                print(f"Warning: cannot send wake-on-LAN packet to {host}: {e}", file=sys.stderr)
+        asleep[host] = time.monotonic() + wake_deadline
+    next_reprobe = time.monotonic() + WOL_REPROBE_INTERVAL
+
+    def timed_status(host):
+        started[host] = time.monotonic()
+        return get_node_status(host, True, use_agent)
+
+    # Using ThreadPoolExecutor because SSH is I/O bound
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    pending = {executor.submit(timed_status, host): host for host in hosts if rtts[host] is not None}
+    try:
+        while pending or asleep:
+            now = time.monotonic()
+            wakeups = [started[h] + deadline for h in pending.values() if h in started]
+            if asleep:
+                wakeups.append(next_reprobe)
+            timeout = max(0, min(wakeups) - now) if wakeups else None
+            if pending:
+                done, _ = concurrent.futures.wait(
+                    pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+            else:
+                time.sleep(timeout)
+                done = ()
+
+            for future in done:
+                host = pending.pop(future)
+                try:
+                    status_text, severity, metrics = future.result()
+                except Exception as e:
+                    status_text, severity, metrics = f"⚪ ERROR: {str(e)}", "Warning", None
+                if host in woke:
+                    status_text += " ⏰ woke on request"
+                results[host] = (status_text, severity, metrics)
+
+            now = time.monotonic()
+            for future, host in list(pending.items()):
+                if host in started and now - started[host] >= deadline:
+                    del pending[future]
+                    results[host] = (f"⚪ TIMEOUT: no result after {deadline:g}s", "Warning", None)
+
+            # Re-probe sleeping hosts; checks of awake hosts keep running meanwhile
+            if asleep and now >= next_reprobe:
+                rtts = probe_hosts(list(asleep), probe)
+                for host in list(asleep):
+                    if rtts[host] is not None:
+                        del asleep[host]
+                        # Slow but awake hosts answer the re-probe too; only
+                        # hosts we sent a packet to count as woken
+                        if host in woken:
+                            woke.add(host)
+                        pending[executor.submit(timed_status, host)] = host
+                    elif time.monotonic() >= asleep[host]:
+                        del asleep[host]
+                        if host in woken:
+                            results[host] = ("🔴 OFFLINE (no response to wake-on-LAN)", "Critical", None)
+                        else:
+                            results[host] = ("🔴 OFFLINE", "Critical", None)
+                next_reprobe = time.monotonic() + WOL_REPROBE_INTERVAL
     finally:
-        if client:
+        # Don't block on hosts that blew their deadline; their own SSH
+        # timeouts end the threads
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+        save_static_cache(STATIC_CACHE)
+        save_latency(LATENCY)
+
+    return [(host,) + results[host] for host in hosts]
+
+class SessionPool:
+    """Authenticated SSH connections to the allowed hosts, opened on demand."""
+
+    def __init__(self, hosts):
+        self.hosts = set(hosts)
+        self.sessions = {}  # host -> [client, last_used]
+        self.locks = {host: threading.Lock() for host in self.hosts}
+
+    def client(self, host):
+        if host not in self.hosts:
+            raise paramiko.SSHException(f"{host} is not a configured host")
+        with self.locks[host]:
+            entry = self.sessions.get(host)
+            transport = entry[0].get_transport() if entry else None
+            if transport is None or not transport.is_active():
+                if entry:
+                    entry[0].close()
+                client = connect_host(host)
+                client.get_transport().set_keepalive(AGENT_KEEPALIVE)
+                entry = self.sessions[host] = [client, time.monotonic()]
+            entry[1] = time.monotonic()
+            return entry[0]
+
+    def run(self, host, command, timeout=SSH_TIMEOUT):
+        """Runs command on host. Returns (stdout, exit_status)."""
+        stdin, stdout, stderr = self.client(host).exec_command(command, timeout=timeout)
+        output = stdout.read().decode('utf-8')
+        return output, stdout.channel.recv_exit_status()
+
+    def evict_idle(self, max_idle=AGENT_IDLE_TIMEOUT):
+        now = time.monotonic()
+        for host in list(self.sessions):
+            with self.locks[host]:
+                entry = self.sessions.get(host)
+                if entry and now - entry[1] > max_idle:
+                    entry[0].close()
+                    del self.sessions[host]
+
+    def close_all(self):
+        for client, _ in list(self.sessions.values()):
             client.close()
+        self.sessions.clear()
+
+class AgentRequestHandler(socketserver.StreamRequestHandler):
+    """Serves newline-delimited JSON requests {host, command, timeout}."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                output, exit_status = self.server.pool.run(
+                    request["host"], request["command"], request.get("timeout", SSH_TIMEOUT)
+                )
+                reply = {"ok": True, "stdout": output, "exit_status": exit_status}
+            except paramiko.AuthenticationException as e:
+                reply = {"ok": False, "auth": True, "error": str(e) or "Authentication failed"}
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+class AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def run_agent():
+    """Runs the session agent in the foreground until interrupted."""
+    hosts = list(dict.fromkeys(MACHINES + list(SSH_USERS)))
+    pool = SessionPool(hosts)
+
+    if AGENT_SOCKET.exists():
+        AGENT_SOCKET.unlink()
+    # Only the owner may use the socket: it runs commands as the SSH users
+    old_umask = os.umask(0o177)
+    try:
+        server = AgentServer(str(AGENT_SOCKET), AgentRequestHandler)
+    finally:
+        os.umask(old_umask)
+    server.pool = pool
+
+    # Treat SIGTERM (launchd/systemd stop) like Ctrl-C
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Session agent listening on {AGENT_SOCKET} for {len(hosts)} hosts")
+
+    # Open sessions to every host up front so the first check is fast too
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for host, error in zip(hosts, executor.map(lambda h: _warm_session(pool, h), hosts)):
+            print(f"  {host}: {'connected' if error is None else error}")
+
+    try:
+        while True:
+            time.sleep(60)
+            pool.evict_idle()
+    except KeyboardInterrupt:
+        print("\nStopping session agent.")
+    finally:
+        server.shutdown()
+        server.server_close()
+        pool.close_all()
+        if AGENT_SOCKET.exists():
+            AGENT_SOCKET.unlink()
+
+def _warm_session(pool, host):
+    try:
+        pool.client(host)
+        return None
+    except Exception as e:
+        return f"not connected ({e})"
+
+class HostHistory:
+    """
+    Round-robin on-disk time series for one host.
+    Layout: header, archive table, then for each archive `slots` rows of
+    (slot_start, count, sum/min/max per metric). A row whose slot_start
+    doesn't match the slot being written is stale and is reset first.
+    """
+
+    MAGIC = b"MACHRRD1"
+    HEADER = struct.Struct("<8sII")
+    ARCHIVE = struct.Struct("<II")
+
+    def __init__(self, path, metrics=HISTORY_METRICS, archives=HISTORY_ARCHIVES):
+        self.metrics = metrics
+        self.archives = archives
+        self.row = struct.Struct("<qq" + "ddd" * len(metrics))
+        table_size = self.HEADER.size + self.ARCHIVE.size * len(archives)
+        self.offsets = []
+        offset = table_size
+        for _, slots in archives:
+            self.offsets.append(offset)
+            offset += slots * self.row.size
+
+        new_file = not path.exists() or path.stat().st_size != offset
+        self.file = open(path, "w+b" if new_file else "r+b")
+        if new_file:
+            self.file.truncate(offset)
+        self.map = mmap.mmap(self.file.fileno(), offset)
+        if new_file:
+            self.HEADER.pack_into(self.map, 0, self.MAGIC, len(metrics), len(archives))
+            for i, archive in enumerate(archives):
+                self.ARCHIVE.pack_into(self.map, self.HEADER.size + i * self.ARCHIVE.size, *archive)
+
+    def update(self, timestamp, values):
+        """Adds one sample (a value per metric, None for missing) to every archive."""
+        for (resolution, slots), base in zip(self.archives, self.offsets):
+            slot_start = int(timestamp) // resolution * resolution
+            offset = base + (slot_start // resolution % slots) * self.row.size
+            row = list(self.row.unpack_from(self.map, offset))
+            if row[0] != slot_start:
+                row = [slot_start, 0] + [0.0, math.inf, -math.inf] * len(self.metrics)
+            row[1] += 1
+            for i, value in enumerate(values):
+                if value is None:
+                    continue
+                j = 2 + 3 * i
+                row[j] += value
+                row[j + 1] = min(row[j + 1], value)
+                row[j + 2] = max(row[j + 2], value)
+            self.row.pack_into(self.map, offset, *row)
+
+    def fetch(self, start, end):
+        """
+        Returns (resolution, rows) from the finest archive that covers start,
+        rows being (slot_start, {metric: (avg, min, max)}) in time order.
+        """
+        for (resolution, slots), base in zip(self.archives, self.offsets):
+            if end - start <= resolution * slots:
+                break
+        rows = []
+        for i in range(slots):
+            row = self.row.unpack_from(self.map, base + i * self.row.size)
+            slot_start, count = row[0], row[1]
+            if count == 0 or not start <= slot_start < end:
+                continue
+            values = {}
+            for k, metric in enumerate(self.metrics):
+                total, low, high = row[2 + 3 * k:5 + 3 * k]
+                if low != math.inf:
+                    values[metric] = (total / count, low, high)
+            rows.append((slot_start, values))
+        rows.sort(key=lambda r: r[0])
+        return resolution, rows
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+def history_path(host):
+    return HISTORY_DIR / f"{host}.rrd"
+
+def record_history(results, timestamp=None):
+    """Writes the metrics of every measured host into its history file."""
+    timestamp = timestamp or time.time()
+    try:
+        HISTORY_DIR.mkdir(exist_ok=True)
+        for host, _, _, metrics in results:
+            if not metrics:
+                continue
+            history = HostHistory(history_path(host))
+            try:
+                history.update(timestamp, [
+                    100.0 * metrics["load1"] / metrics["cores"],
+                    metrics["cpu_busy_pct"],
+                    metrics["mem_used_pct"],
+                    metrics["iowait_pct"],
+                ])
+            finally:
+                history.close()
+    except OSError as e:
+        print(f"Warning: cannot write load history to {HISTORY_DIR}: {e}", file=sys.stderr)
+
+def print_history_report(hosts=None):
+    """Prints per-host load and memory percentiles over the last day, week and month."""
+    paths = [history_path(h) for h in hosts] if hosts else sorted(HISTORY_DIR.glob("*.rrd"))
+    paths = [p for p in paths if p.exists()]
+    if not paths:
+        print(f"No load history yet (stored in {HISTORY_DIR}/). Run a check first.")
+        return
+
+    now = time.time()
+    print(f"\n{'='*86}")
+    print("  Machine utilisation history (load % of cores, memory % used)")
+    print(f"{'='*86}")
+    print(f"  {'Host':<30} {'Window':<6} {'Samples':>7} {'Load p50':>9} {'p95':>6} {'max':>6} "
+          f"{'Mem p50':>8} {'p95':>6}")
+    for path in paths:
+        history = HostHistory(path)
+        try:
+            for label, span in REPORT_WINDOWS:
+                _, rows = history.fetch(now - span, now)
+                load = [v["load_pct"][0] for _, v in rows if "load_pct" in v]
+                load_max = [v["load_pct"][2] for _, v in rows if "load_pct" in v]
+                mem = [v["mem_used_pct"][0] for _, v in rows if "mem_used_pct" in v]
+                if not load:
+                    print(f"  {path.stem:<30} {label:<6} {0:>7} {'-':>9} {'-':>6} {'-':>6} {'-':>8} {'-':>6}")
+                    continue
+                print(f"  {path.stem:<30} {label:<6} {len(load):>7} {percentile(load, 50):>8.0f}% "
+                      f"{percentile(load, 95):>5.0f}% {max(load_max):>5.0f}% "
+                      f"{percentile(mem, 50):>7.0f}% {percentile(mem, 95):>5.0f}%")
+        finally:
+            history.close()
+
+def save_pick_cache(results):
+    """Stores the metrics of a sweep for pick_machines."""
+    hosts = {host: metrics for host, _, severity, metrics in results if metrics and severity != "Critical"}
+    tmp = PICK_CACHE_FILE.with_suffix(".tmp")
+    try:
+        with open(tmp, "w") as f:
+            json.dump({"updated": time.time(), "hosts": hosts}, f)
+        os.replace(tmp, PICK_CACHE_FILE)
+    except OSError as e:
+        print(f"Warning: cannot write {PICK_CACHE_FILE}: {e}", file=sys.stderr)
+
+def load_pick_cache(max_age=PICK_CACHE_TTL):
+    """Returns {host: metrics} from the last sweep, or None if older than max_age."""
+    try:
+        with open(PICK_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - cache.get("updated", 0) > max_age:
+        return None
+    return cache["hosts"]
+
+def pick_machines(n=1, min_cores=0, min_mem_gb=0, max_age=PICK_CACHE_TTL, hosts=None):
+    """
+    Returns up to n machine names best suited for a new job, most idle first.
+    Machines are ranked by idle cores (cores minus 1-minute load), then by
+    available memory; min_cores and min_mem_gb filter on those idle values.
+    Uses metrics cached within max_age seconds, otherwise runs one sweep
+    (concurrent callers wait for it instead of starting their own). The
+    sweep does not wake sleeping machines or wait for them.
+    """
+    hosts = hosts or MACHINES
+    cached = load_pick_cache(max_age)
+    if cached is None:
+        with open(PICK_CACHE_FILE.with_suffix(".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            cached = load_pick_cache(max_age)
+            if cached is None:
+                results = check_all_hosts(hosts, wake=False)
+                record_history(results)
+                save_pick_cache(results)
+                cached = load_pick_cache(float("inf"))
+
+    candidates = []
+    for host in hosts:
+        metrics = cached.get(host)
+        if not metrics:
+            continue
+        idle_cores = metrics["cores"] - metrics["load1"]
+        free_mem_gb = metrics["mem_total_kb"] * (100.0 - metrics["mem_used_pct"]) / 100.0 / 1024 ** 2
+        if idle_cores < min_cores or free_mem_gb < min_mem_gb:
+            continue
+        candidates.append((idle_cores, free_mem_gb, host))
+
+    candidates.sort(reverse=True)
+    return [host for _, _, host in candidates[:n]]
 
 def send_slack_report(full_status_list):
     if not SLACK_WEBHOOK_URL:
@@ -145,9 +1133,34 @@ def send_slack_report(full_status_list):
 
 def main():
     parser = argparse.ArgumentParser(description="Check cluster health")
+    parser.add_argument("command", nargs="?", choices=["check", "agent", "report", "pick"], default="check",
+                        help="check machines (default), run the persistent SSH session agent, "
+                             "print utilisation percentiles from the load history, "
+                             "or print the least-loaded machines for a job")
     parser.add_argument("--test", action="store_true", help="Print report to stdout instead of sending to Slack")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help=f"Number of hosts checked in parallel (default: {MAX_WORKERS})")
+    parser.add_argument("--deadline", type=float, default=HOST_DEADLINE,
+                        help=f"Seconds before a single host is reported as timed out (default: {HOST_DEADLINE})")
+    parser.add_argument("--probe", choices=["tcp", "icmp", "ping"], default=PROBE_METHOD,
+                        help=f"Reachability probe: tcp (SSH port), icmp (echo socket) or ping (system ping) "
+                             f"(default: {PROBE_METHOD})")
+    parser.add_argument("--no-agent", action="store_true",
+                        help="Connect directly even if the session agent is running")
+    parser.add_argument("-n", type=int, default=1, help="pick: number of machines to return (default: 1)")
+    parser.add_argument("--min-cores", type=float, default=0, help="pick: minimum idle cores")
+    parser.add_argument("--min-mem", type=float, default=0, help="pick: minimum available memory in GB")
     args = parser.parse_args()
 
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.deadline <= 0:
+        parser.error("--deadline must be positive")
+
+    if args.command == "report":
+        print_history_report(MACHINES)
+        return
+
     # Validate required environment variables
     if not MACHINES:
         print("ERROR: MACHINES environment variable must be set (comma-separated hostnames)", file=sys.stderr)
@@ -157,19 +1170,36 @@ def main():
         print("ERROR: SSH_USER environment variable must be set", file=sys.stderr)
         sys.exit(1)
 
+    if not SSH_PASSWORD:
+        print("ERROR: SSH_PASSWORD environment variable must be set", file=sys.stderr)
+        sys.exit(1)
+
+    if args.command == "agent":
+        run_agent()
+        return
+
+    if args.command == "pick":
+        picked = pick_machines(args.n, args.min_cores, args.min_mem)
+        if not picked:
+            print("No machine matches the requirements.", file=sys.stderr)
+            sys.exit(1)
+        print("\n".join(picked))
+        return
+
     if not args.test and not SLACK_WEBHOOK_URL:
         print("ERROR: SLACK_WEBHOOK_UNIX environment variable must be set", file=sys.stderr)
         sys.exit(1)
 
-    if not SSH_PASSWORD:
-        print("ERROR: SSH_PASSWORD environment variable must be set", file=sys.stderr)
-        sys.exit(1)
+    results = check_all_hosts(MACHINES, args.workers, args.deadline, args.probe, use_agent=not args.no_agent)
+    record_history(results)
+    save_pick_cache(results)
 
     full_report = []
-
-    for host in MACHINES:
-        status_text, severity = get_node_status(host)
+    for host, status_text, severity, metrics in results:
         full_report.append(f"*{host}*: {status_text}")
+        drilldown = format_drilldown(metrics) if metrics else ""
+        if drilldown:
+            full_report.append(f"    ↳ {drilldown}")
 
     if args.test:
         print("\n".join(full_report))
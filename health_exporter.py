@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+Health Exporter
+Runs the check_machines.py and check_acme.py sweeps on a schedule, keeps the
+latest results in memory and serves them over HTTP, so dashboards and
+scripts can read machine and node status without their own SSH sweeps.
+
+Usage:
+    python health_exporter.py
+    python health_exporter.py --interval 120 --port 9105
+    python health_exporter.py --sources machines
+
+Endpoints:
+    /metrics       Prometheus text format
+    /health.json   JSON per source: entries per host/node plus the age of the sweep
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Importing the checkers also loads .env and their configuration
+import check_acme
+import check_machines
+
+# --- CONFIGURATION ---
+DEFAULT_INTERVAL = 300
+DEFAULT_BIND = "127.0.0.1"
+DEFAULT_PORT = 9105
+
+# Latest sweep per source: {"updated": epoch, "duration": s, "error": str|None, "entries": [...]}
+RESULTS = {}
+RESULTS_LOCK = threading.Lock()
+
+# --- SWEEPS ---
+
+def sweep_machines(state):
+    """
+    Checks every machine. Returns a list of per-host entry dicts.
+    Sleeping machines are reported offline, not woken with wake-on-LAN.
+    """
+    results = check_machines.check_all_hosts(check_machines.MACHINES, wake=False)
+    check_machines.record_history(results)
+    return [
+        {"host": host, "up": severity != "Critical", "status": status_text,
+         "severity": severity, "metrics": metrics}
+        for host, status_text, severity, metrics in results
+    ]
+
+def sweep_acme(state, inventory="static"):
+    """
+    Probes every ACME node with one batch command over a head node
+    connection that is kept open between sweeps.
+    Returns a list of per-node entry dicts
+    """
+    gateway = state.get("gateway")
+    transport = gateway.get_transport() if gateway else None
+    if transport is None or not transport.is_active():
+        if gateway:
+            gateway.close()
+        check_acme.load_adaptive_timeouts()
+        gateway, handshake_time = check_acme.connect_head_node()
+        state.update(gateway=gateway, handshake_time=handshake_time,
+                     nodes=check_acme.load_nodes(gateway, inventory))
+
+    results = check_acme.probe_nodes(gateway, state["nodes"], batch=True, verbose=False)
+    check_acme.record_history(results, state["handshake_time"])
+    return [
+        {"node": name, "up": is_up, "rtt_ms": rtt_ms, "retries": retries, "error": error}
+        for name, is_up, error, rtt_ms, retries in results
+    ]
+
+def run_sweeper(source, sweep, interval):
+    """Runs sweep every `interval` seconds and stores its latest result for source."""
+    state = {}
+    while True:
+        start = time.monotonic()
+        entries, error = None, None
+        try:
+            entries = sweep(state)
+        except Exception as e:
+            error = str(e)
+            print(f"[{time.strftime('%H:%M:%S')}] {source} sweep failed: {error}", file=sys.stderr)
+            # Reconnect on the next sweep; close the old client so its transport thread exits
+            gateway = state.pop("gateway", None)
+            if gateway:
+                gateway.close()
+
+        with RESULTS_LOCK:
+            previous = RESULTS.get(source, {})
+            RESULTS[source] = {
+                # Keep serving the last good entries (with their growing age) if a sweep fails
+                "updated": time.time() if entries is not None else previous.get("updated"),
+                "duration": time.monotonic() - start,
+                "error": error,
+                "entries": entries if entries is not None else previous.get("entries", []),
+            }
+        time.sleep(max(0, interval - (time.monotonic() - start)))
+
+# --- RENDERING ---
+
+def snapshot():
+    """Returns a copy of the latest results with each source's age in seconds."""
+    now = time.time()
+    with RESULTS_LOCK:
+        return {
+            source: dict(result, age_seconds=now - result["updated"] if result["updated"] else None)
+            for source, result in RESULTS.items()
+        }
+
+def prometheus_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus(results):
+    """Renders a snapshot in the Prometheus text exposition format."""
+    metrics = {
+        "lab_sweep_age_seconds": ("gauge", "Seconds since the last successful sweep", []),
+        "lab_sweep_duration_seconds": ("gauge", "Duration of the last sweep", []),
+        "lab_sweep_success": ("gauge", "1 if the last sweep succeeded", []),
+        "lab_host_up": ("gauge", "1 if the host or node is reachable", []),
+        "lab_host_load1": ("gauge", "1-minute load average", []),
+        "lab_host_cores": ("gauge", "Number of CPU cores", []),
+        "lab_host_mem_used_percent": ("gauge", "Percent of memory in use", []),
+        "lab_host_iowait_percent": ("gauge", "Percent of CPU time waiting on I/O", []),
+        "lab_node_rtt_ms": ("gauge", "Ping round-trip time from the head node", []),
+    }
+
+    for source, result in results.items():
+        labels = f'source="{prometheus_label(source)}"'
+        if result["age_seconds"] is not None:
+            metrics["lab_sweep_age_seconds"][2].append((labels, result["age_seconds"]))
+        metrics["lab_sweep_duration_seconds"][2].append((labels, result["duration"]))
+        metrics["lab_sweep_success"][2].append((labels, 0 if result["error"] else 1))
+
+        for entry in result["entries"]:
+            name = entry.get("host") or entry.get("node")
+            entry_labels = f'{labels},host="{prometheus_label(name)}"'
+            metrics["lab_host_up"][2].append((entry_labels, int(entry["up"])))
+            host_metrics = entry.get("metrics")
+            if host_metrics:
+                metrics["lab_host_load1"][2].append((entry_labels, host_metrics["load1"]))
+                metrics["lab_host_cores"][2].append((entry_labels, host_metrics["cores"]))
+                metrics["lab_host_mem_used_percent"][2].append((entry_labels, host_metrics["mem_used_pct"]))
+                metrics["lab_host_iowait_percent"][2].append((entry_labels, host_metrics["iowait_pct"]))
+            if entry.get("rtt_ms") is not None:
+                metrics["lab_node_rtt_ms"][2].append((entry_labels, entry["rtt_ms"]))
+
+    lines = []
+    for name, (kind, help_text, samples) in metrics.items():
+        if not samples:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{{{labels}}} {value:g}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+class ExporterHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        results = snapshot()
+        if self.path == "/metrics":
+            body = render_prometheus(results).encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/health.json":
+            body = json.dumps(results, indent=1).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404, "Try /metrics or /health.json")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve cached machine and ACME node health over HTTP")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                        help=f"Seconds between sweeps (default: {DEFAULT_INTERVAL})")
+    parser.add_argument("--bind", default=DEFAULT_BIND, help=f"Address to listen on (default: {DEFAULT_BIND})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--sources", nargs="+", choices=["machines", "acme"], default=["machines", "acme"],
+                        help="Sweeps to run (default: machines acme)")
+    parser.add_argument("--inventory", default="static", metavar="SOURCE",
+                        help="ACME node list source, as for check_acme.py --inventory")
+    args = parser.parse_args()
+
+    if args.interval <= 0:
+        parser.error("--interval must be positive")
+
+    sweeps = {}
+    if "machines" in args.sources:
+        if not (check_machines.MACHINES and check_machines.SSH_USER and check_machines.SSH_PASSWORD):
+            print("ERROR: MACHINES, SSH_USER and SSH_PASSWORD must be set for the machines sweep", file=sys.stderr)
+            sys.exit(1)
+        sweeps["machines"] = sweep_machines
+    if "acme" in args.sources:
+        if not (check_acme.HEAD_NODE_IP and check_acme.HEAD_NODE_USER and check_acme.SSH_PASSWORD):
+            print("ERROR: HEAD_NODE_IP, HEAD_NODE_USER and SSH_PASSWORD must be set for the acme sweep", file=sys.stderr)
+            sys.exit(1)
+        sweeps["acme"] = lambda state: sweep_acme(state, args.inventory)
+
+    for source, sweep in sweeps.items():
+        threading.Thread(target=run_sweeper, args=(source, sweep, args.interval), daemon=True).start()
+
+    server = ThreadingHTTPServer((args.bind, args.port), ExporterHandler)
+    print(f"Serving {', '.join(sweeps)} health on http://{args.bind}:{args.port}/metrics "
+          f"(sweep every {args.interval:g}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping exporter.")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
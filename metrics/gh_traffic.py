@@ -1,14 +1,19 @@
 #!/usr/bin/env python3
 """
 GitHub Traffic Logger
-Fetches traffic stats (views, clones) for GitHub repos and appends them to local
-CSVs. Run weekly via cron to avoid losing the 14-day window.
+Fetches traffic stats (views, clones) for GitHub repos and stores them in a
+local SQLite database, one row per repo and day. Run weekly via cron to avoid
+losing the 14-day window.
 
 Usage:
     python gh_traffic.py
     python gh_traffic.py --orgs patonlab bobbypaton
     python gh_traffic.py --repos patonlab/aqme patonlab/goodvibes
     python gh_traffic.py --test
+    python gh_traffic.py collect --workers 16
+    python gh_traffic.py import
+    python gh_traffic.py convert --to columnar
+    python gh_traffic.py summary --format columnar
 
 Setup:
     Set GITHUB_TOKEN in your .env file (needs push access to target repos).
@@ -16,9 +21,17 @@ Setup:
 """
 
 import argparse
+import concurrent.futures
 import csv
+import hashlib
+import json
 import os
+import re
+import sqlite3
+import struct
 import sys
+import threading
+import time
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -43,9 +56,51 @@ except ImportError:
 # ── Config ────────────────────────────────────────────────────────────────────
 DEFAULT_ORGS = ["patonlab"]
 DATA_DIR = Path(__file__).resolve().parent / "data"
+DB_PATH = DATA_DIR / "gh_traffic.db"
+# Legacy CSV logs, imported into the database once by `import`
 VIEWS_CSV = DATA_DIR / "gh_views.csv"
 CLONES_CSV = DATA_DIR / "gh_clones.csv"
-API_BASE = "https://api.github.com"
+# Optional columnar copies of the daily history (needs NumPy), see write_columnar
+VIEWS_COL = DATA_DIR / "gh_views.col"
+CLONES_COL = DATA_DIR / "gh_clones.col"
+# convert --to csv writes here, never over the legacy logs open_db imports
+VIEWS_EXPORT_CSV = DATA_DIR / "gh_views_export.csv"
+CLONES_EXPORT_CSV = DATA_DIR / "gh_clones_export.csv"
+# GITHUB_API_URL points the script at another server, e.g. a local stand-in for testing
+API_BASE = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+API_TIMEOUT = 30
+WORKERS = 8          # concurrent API requests during collection
+HTTP_POOL_SIZE = 32  # keep-alive connections kept open to the API
+GRAPHQL_BATCH = 50   # repositories per GraphQL stats query
+
+# Repo metadata found while enumerating owners in this run, reused for stats:
+# full_name -> {private, archived, pushed_at, stars, forks, watchers}
+REPO_METADATA = {}
+
+# Response cache: API responses are kept under CACHE_DIR with their ETag.
+# A response younger than its endpoint's TTL is served without a request;
+# older ones are revalidated with If-None-Match (a 304 doesn't count against
+# the rate limit). First matching pattern wins; other endpoints have TTL 0.
+CACHE_DIR = DATA_DIR / "http_cache"
+CACHE_MAX_BYTES = 20 * 1024 * 1024
+CACHE_TTLS = [
+    (re.compile(r"^/(orgs|users)/[^/]+/repos\b"), 24 * 3600),
+    (re.compile(r"^/users/[^/]+$"), 7 * 24 * 3600),
+    (re.compile(r"^/repos/[^/]+/[^/]+$"), 6 * 3600),
+    (re.compile(r"^/graphql "), 6 * 3600),
+]
+USE_CACHE = True
+
+# Rate limiting: every response's X-RateLimit-* headers update a shared
+# budget. Requests pause until the reset when only RATE_LIMIT_RESERVE calls
+# are left, run one at a time below RATE_LIMIT_SLOW, and back off on
+# secondary limits (Retry-After, else SECONDARY_BACKOFF doubling up to the max).
+RATE_LIMIT_RESERVE = 5
+RATE_LIMIT_SLOW = 100
+SECONDARY_BACKOFF = 60
+SECONDARY_BACKOFF_MAX = 900
+RATE_LIMIT_RETRIES = 5
+RATE_LIMIT_MAX_WAIT = 3900  # the primary limit resets within the hour
 # ─────────────────────────────────────────────────────────────────────────────
 
 
@@ -57,120 +112,438 @@ def get_token():
     return token
 
 
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the shared requests session, creating its keep-alive pool on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def rate_limit_resource(endpoint):
+    """The rate limit budget ("core" or "graphql") a request to endpoint counts against."""
+    return "graphql" if endpoint == "/graphql" else "core"
+
+
+class RateLimiter:
+    """
+    Shared API budgets, one per rate limit resource ("core" for REST,
+    "graphql"), updated from the rate limit headers of every response.
+    acquire() blocks a request until it may be sent; release() records the
+    response and tells whether it was rate limited. Secondary limits pause
+    every request.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.remaining = {}  # resource -> requests left in the current window
+        self.reset = {}      # resource -> epoch seconds the window resets
+        self.in_flight = {}  # resource -> requests sent but not yet released
+        self.blocked_until = 0.0
+        self.announced_until = 0.0
+        self.backoff = SECONDARY_BACKOFF
+
+    def _delay(self, now, resource):
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        remaining = self.remaining.get(resource)
+        reset = self.reset.get(resource, 0.0)
+        in_flight = self.in_flight.get(resource, 0)
+        if remaining is not None and now < reset:
+            if remaining - in_flight <= RATE_LIMIT_RESERVE:
+                return reset - now + 1
+            if remaining < RATE_LIMIT_SLOW and in_flight:
+                return 0.2
+        return 0
+
+    def acquire(self, resource="core"):
+        """Wait until a request may be sent. Returns False if that is more than RATE_LIMIT_MAX_WAIT away."""
+        while True:
+            with self.lock:
+                now = time.time()
+                delay = self._delay(now, resource)
+                if delay <= 0:
+                    self.in_flight[resource] = self.in_flight.get(resource, 0) + 1
+                    return True
+                if delay > RATE_LIMIT_MAX_WAIT:
+                    return False
+                if delay >= 5 and now + delay > self.announced_until:
+                    self.announced_until = now + delay
+                    resume = datetime.fromtimestamp(now + delay).strftime("%H:%M:%S")
+                    print(f"  ⏳ GitHub API rate limit: pausing requests until {resume}")
+            time.sleep(min(delay, 5))
+
+    def release(self, resp, resource="core"):
+        """Record a response (None if the request failed). Returns True if it was rate limited."""
+        with self.lock:
+            self.in_flight[resource] -= 1
+            if resp is None:
+                return False
+            headers = resp.headers
+            if "X-RateLimit-Remaining" in headers:
+                # The headers describe the budget named by X-RateLimit-Resource
+                budget = headers.get("X-RateLimit-Resource", resource)
+                self.remaining[budget] = int(headers["X-RateLimit-Remaining"])
+                self.reset[budget] = float(headers.get("X-RateLimit-Reset", 0))
+            if resp.status_code not in (403, 429):
+                self.backoff = SECONDARY_BACKOFF
+                return False
+
+            now = time.time()
+            retry_after = headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                self.blocked_until = max(self.blocked_until, now + int(retry_after))
+            elif self.remaining.get(resource) == 0:
+                # acquire() holds this resource's requests until its reset
+                pass
+            elif "rate limit" in resp.text.lower():
+                # Secondary limit without Retry-After; concurrent hits back off once
+                if self.blocked_until <= now:
+                    self.blocked_until = now + self.backoff
+                    self.backoff = min(self.backoff * 2, SECONDARY_BACKOFF_MAX)
+            else:
+                return False
+            return True
+
+
+RATE_LIMIT = RateLimiter()
+
+_cache_lock = threading.Lock()
+_cache_size = None
+
+
+def _cache_path(endpoint, token):
+    # Keyed by token too: what a response contains depends on its access
+    key = hashlib.sha1(f"{token}\n{endpoint}".encode()).hexdigest()
+    return CACHE_DIR / f"{key}.json"
+
+
+def cache_ttl(endpoint):
+    """Seconds a cached response for endpoint is served without revalidation."""
+    for pattern, ttl in CACHE_TTLS:
+        if pattern.search(endpoint):
+            return ttl
+    return 0
+
+
+def cache_get(endpoint, token):
+    """Return the cached {etag, fetched, body} entry for endpoint, or None."""
+    path = _cache_path(endpoint, token)
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+        os.utime(path)  # eviction drops the least recently used entries
+        return entry
+    except (OSError, ValueError):
+        return None
+
+
+def cache_put(endpoint, token, etag, body):
+    """Store a response, then evict old entries if the cache is over CACHE_MAX_BYTES."""
+    global _cache_size
+    path = _cache_path(endpoint, token)
+    data = json.dumps({"endpoint": endpoint, "etag": etag, "fetched": time.time(), "body": body})
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        old_size = path.stat().st_size if path.exists() else 0
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"  ⚠ Cannot write response cache: {e}")
+        return
+
+    with _cache_lock:
+        if _cache_size is None:
+            _cache_size = sum(p.stat().st_size for p in CACHE_DIR.glob("*.json"))
+        else:
+            _cache_size += len(data) - old_size
+        if _cache_size > CACHE_MAX_BYTES:
+            _cache_size = evict_cache(CACHE_MAX_BYTES * 3 // 4)
+
+
+def evict_cache(target_bytes):
+    """Delete least recently used cache entries until the cache fits target_bytes. Returns its size."""
+    entries = []
+    for path in CACHE_DIR.glob("*.json"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    size = sum(e[1] for e in entries)
+    for _, entry_size, path in sorted(entries):
+        if size <= target_bytes:
+            break
+        try:
+            path.unlink()
+            size -= entry_size
+        except OSError:
+            pass
+    return size
+
+
+def _send(method, endpoint, token, headers=None, **kwargs):
+    """
+    Send one authenticated API request through the rate limiter, retrying
+    it after the pause if it was rate limited. Returns the response, or
+    None if the request failed or had to be given up.
+    """
+    headers = dict(headers or {}, **{
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/vnd.github+json",
+    })
+    resource = rate_limit_resource(endpoint)
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        if not RATE_LIMIT.acquire(resource):
+            print(f"  ⚠ GitHub API rate limit: skipping {endpoint}, the reset is too far away")
+            return None
+        resp = None
+        try:
+            resp = get_session().request(method, f"{API_BASE}{endpoint}", headers=headers,
+                                         timeout=API_TIMEOUT, **kwargs)
+        except requests.RequestException as e:
+            print(f"  ⚠ Request failed for {endpoint}: {e}")
+            return None
+        finally:
+            limited = RATE_LIMIT.release(resp, resource)
+        if not limited:
+            return resp
+    print(f"  ⚠ GitHub API rate limit: giving up on {endpoint} after {RATE_LIMIT_RETRIES} retries")
+    return None
+
+
 def api_get(endpoint, token):
-    """Make an authenticated GET request to the GitHub API."""
-    resp = requests.get(
-        f"{API_BASE}{endpoint}",
-        headers={
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/vnd.github+json",
-        },
-    )
-    if resp.status_code == 403 and "rate limit" in resp.text.lower():
-        print("  ⚠ GitHub API rate limit reached")
+    """
+    Make an authenticated GET request to the GitHub API, served from or
+    revalidated against the response cache. Rate limited requests wait for
+    the reset or backoff and are retried instead of being dropped.
+    """
+    cached = cache_get(endpoint, token) if USE_CACHE else None
+    if cached and time.time() - cached["fetched"] < cache_ttl(endpoint):
+        return cached["body"]
+
+    headers = {}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    resp = _send("GET", endpoint, token, headers)
+    if resp is None:
         return None
+    if resp.status_code == 304 and cached:
+        cache_put(endpoint, token, cached["etag"], cached["body"])
+        return cached["body"]
     if resp.status_code != 200:
         print(f"  ⚠ HTTP {resp.status_code} for {endpoint}: {resp.text[:200]}")
         return None
-    return resp.json()
+    body = resp.json()
+    if USE_CACHE:
+        cache_put(endpoint, token, resp.headers.get("ETag"), body)
+    return body
+
+
+OWNER_REPOS_QUERY = """
+query($owner: String!, $after: String) {
+  repositoryOwner(login: $owner) {
+    repositories(first: 100, after: $after) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        nameWithOwner isPrivate isArchived pushedAt
+        stargazerCount forkCount watchers { totalCount }
+      }
+    }
+  }
+}
+"""
 
 
-def list_org_repos(org, token):
-    """List all repos for an org/user (public + private if token has access)."""
+def _list_owner_repos_graphql(owner, token):
+    """Page through an owner's repos with GraphQL, which resolves org vs user itself. None on failure."""
+    repos = []
+    after = None
+    while True:
+        body = api_graphql(OWNER_REPOS_QUERY, {"owner": owner, "after": after}, token)
+        if body is None or body.get("errors"):
+            return None
+        owner_data = (body.get("data") or {}).get("repositoryOwner")
+        if owner_data is None:
+            print(f"  ⚠ No GitHub org or user named '{owner}'")
+            return []
+        page = owner_data["repositories"]
+        repos.extend({
+            "full_name": node["nameWithOwner"],
+            "private": node["isPrivate"],
+            "archived": node["isArchived"],
+            "pushed_at": node["pushedAt"],
+            "stars": node["stargazerCount"],
+            "forks": node["forkCount"],
+            "watchers": node["watchers"]["totalCount"],
+        } for node in page["nodes"])
+        if not page["pageInfo"]["hasNextPage"]:
+            return repos
+        after = page["pageInfo"]["endCursor"]
+
+
+def _list_owner_repos_rest(owner, token):
+    """Look up once whether owner is an org or a user, then page through its repos with REST."""
+    account = api_get(f"/users/{owner}", token)
+    if account is None:
+        return []
+    kind = "orgs" if account.get("type") == "Organization" else "users"
     repos = []
     page = 1
     while True:
-        data = api_get(f"/orgs/{org}/repos?per_page=100&page={page}&type=all", token)
-        if data is None:
-            # Try as user instead of org
-            data = api_get(f"/users/{org}/repos?per_page=100&page={page}&type=all", token)
+        data = api_get(f"/{kind}/{owner}/repos?per_page=100&page={page}&type=all", token)
         if not data:
             break
-        repos.extend(data)
+        repos.extend({
+            "full_name": r["full_name"],
+            "private": r.get("private", False),
+            "archived": r.get("archived", False),
+            "pushed_at": r.get("pushed_at"),
+            "stars": r.get("stargazers_count", 0),
+            "forks": r.get("forks_count", 0),
+            "watchers": None,  # subscribers_count is only in the single-repo response
+        } for r in data)
         if len(data) < 100:
             break
         page += 1
-    return [r["full_name"] for r in repos]
+    return repos
 
 
-def append_csv(filepath, fieldnames, rows):
-    """Append rows to a CSV, creating with headers if it doesn't exist."""
-    exists = filepath.exists() and filepath.stat().st_size > 0
-    with open(filepath, "a", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if not exists:
-            writer.writeheader()
-        writer.writerows(rows)
-
-
-def fetch_and_log_traffic(repo, token, test=False):
-    """Fetch all traffic data for a repo and append to CSVs."""
-    collected = datetime.now(timezone.utc).isoformat()
-    new_views = 0
-    new_clones = 0
-
-    # Views (daily breakdown)
-    data = api_get(f"/repos/{repo}/traffic/views", token)
-    if data and data.get("views"):
-        rows = []
-        for v in data["views"]:
-            rows.append({
-                "repo": repo,
-                "date": v["timestamp"][:10],
-                "views": v["count"],
-                "unique_views": v["uniques"],
-                "collected": collected,
-            })
-        new_views = len(rows)
-        if not test:
-            append_csv(VIEWS_CSV, ["repo", "date", "views", "unique_views", "collected"], rows)
-
-    # Clones (daily breakdown)
-    data = api_get(f"/repos/{repo}/traffic/clones", token)
-    if data and data.get("clones"):
-        rows = []
-        for c in data["clones"]:
-            rows.append({
-                "repo": repo,
-                "date": c["timestamp"][:10],
-                "clones": c["count"],
-                "unique_clones": c["uniques"],
-                "collected": collected,
-            })
-        new_clones = len(rows)
-        if not test:
-            append_csv(CLONES_CSV, ["repo", "date", "clones", "unique_clones", "collected"], rows)
-
-    return new_views, new_clones
-
+def list_owner_repos(owner, token):
+    """
+    List all repos of an org or user (public + private if token has access)
+    with their metadata, and remember it in REPO_METADATA for this run.
+    Returns list of dicts with full_name, private, archived, pushed_at, stars, forks, watchers
+    """
+    repos = _list_owner_repos_graphql(owner, token)
+    if repos is None:
+        repos = _list_owner_repos_rest(owner, token)
+    for repo in repos:
+        REPO_METADATA[repo["full_name"]] = repo
+    return repos
 
-def deduplicate_csv(filepath, verbose=True):
-    """Remove duplicate rows from a CSV based on all columns except 'collected'."""
-    if not filepath.exists():
-        return
-    with open(filepath, newline="") as f:
-        reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames
-        rows = list(reader)
-
-    # Deduplicate by all fields except 'collected' (keep first occurrence)
-    seen = set()
-    unique = []
-    key_fields = [f for f in fieldnames if f != "collected"]
-    for row in rows:
-        key = tuple(row[f] for f in key_fields)
-        if key not in seen:
-            seen.add(key)
-            unique.append(row)
-
-    with open(filepath, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(unique)
 
-    removed = len(rows) - len(unique)
-    if removed and verbose:
-        print(f"  Deduplicated {filepath.name}: removed {removed} duplicate rows")
+def list_org_repos(org, token):
+    """List the full names of all repos for an org/user."""
+    return [r["full_name"] for r in list_owner_repos(org, token)]
+
+
+TRAFFIC_FIELDS = {
+    "views": ["repo", "date", "views", "unique_views", "collected"],
+    "clones": ["repo", "date", "clones", "unique_clones", "collected"],
+}
+
+
+def fetch_traffic(repo, kind, token, collected):
+    """Fetch the daily "views" or "clones" breakdown for a repo as daily rows."""
+    data = api_get(f"/repos/{repo}/traffic/{kind}", token)
+    if not data or not data.get(kind):
+        return []
+    return [
+        {
+            "repo": repo,
+            "date": d["timestamp"][:10],
+            kind: d["count"],
+            f"unique_{kind}": d["uniques"],
+            "collected": collected,
+        }
+        for d in data[kind]
+    ]
+
+
+def open_db(path=None):
+    """
+    Open the traffic database in WAL mode, creating its tables if needed.
+    Each daily table has a {kind}_monthly rollup per (repo, "YYYY-MM"),
+    kept up to date by triggers on every insert or corrected count.
+    A new database starts with the contents of the legacy CSV logs.
+    """
+    path = path or DB_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    new = not path.exists()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for kind in TRAFFIC_FIELDS:
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {kind} ("
+            f"repo TEXT NOT NULL, date TEXT NOT NULL, {kind} INTEGER NOT NULL, "
+            f"unique_{kind} INTEGER NOT NULL, collected TEXT NOT NULL, "
+            f"PRIMARY KEY (repo, date)) WITHOUT ROWID"
+        )
+        rollup_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f"{kind}_monthly",)
+        ).fetchone()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {kind}_monthly ("
+            f"repo TEXT NOT NULL, month TEXT NOT NULL, {kind} INTEGER NOT NULL, "
+            f"unique_{kind} INTEGER NOT NULL, PRIMARY KEY (repo, month)) WITHOUT ROWID"
+        )
+        if not rollup_exists:
+            # Databases created before the rollups: build them once from the daily rows
+            conn.execute(
+                f"INSERT INTO {kind}_monthly SELECT repo, substr(date, 1, 7), SUM({kind}), "
+                f"SUM(unique_{kind}) FROM {kind} GROUP BY repo, substr(date, 1, 7)"
+            )
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {kind}_rollup_insert AFTER INSERT ON {kind} BEGIN "
+            f"INSERT INTO {kind}_monthly VALUES "
+            f"(NEW.repo, substr(NEW.date, 1, 7), NEW.{kind}, NEW.unique_{kind}) "
+            f"ON CONFLICT (repo, month) DO UPDATE SET {kind} = {kind} + excluded.{kind}, "
+            f"unique_{kind} = unique_{kind} + excluded.unique_{kind}; END"
+        )
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {kind}_rollup_update AFTER UPDATE ON {kind} BEGIN "
+            f"UPDATE {kind}_monthly SET {kind} = {kind} - OLD.{kind} + NEW.{kind}, "
+            f"unique_{kind} = unique_{kind} - OLD.unique_{kind} + NEW.unique_{kind} "
+            f"WHERE repo = NEW.repo AND month = substr(NEW.date, 1, 7); END"
+        )
+    conn.commit()
+    if new:
+        import_csvs(conn, verbose=False)
+    return conn
+
+
+def upsert_rows(conn, kind, rows):
+    """
+    Store daily "views" or "clones" rows keyed on (repo, date). A day that is
+    already stored is overwritten by a more recently collected count, so
+    partial-day counts are replaced rather than added.
+    """
+    fields = TRAFFIC_FIELDS[kind]
+    sql = (
+        f"INSERT INTO {kind} ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))}) "
+        f"ON CONFLICT (repo, date) DO UPDATE SET {kind} = excluded.{kind}, "
+        f"unique_{kind} = excluded.unique_{kind}, collected = excluded.collected "
+        f"WHERE excluded.collected >= {kind}.collected"
+    )
+    with conn:
+        conn.executemany(sql, ([row[f] for f in fields] for row in rows))
+
+
+def import_csvs(conn, verbose=True):
+    """Import the legacy gh_views.csv / gh_clones.csv logs into the database (safe to re-run)."""
+    for kind, path in (("views", VIEWS_CSV), ("clones", CLONES_CSV)):
+        if not path.exists():
+            continue
+        with open(path, newline="") as f:
+            rows = [
+                dict(row, **{kind: int(row[kind]), f"unique_{kind}": int(row[f"unique_{kind}"])})
+                for row in csv.DictReader(f)
+            ]
+        upsert_rows(conn, kind, rows)
+        if verbose:
+            print(f"  Imported {len(rows)} rows from {path.name}")
 
 
 def fetch_repo_stats(repo, token):
@@ -185,17 +558,239 @@ def fetch_repo_stats(repo, token):
     )
 
 
-def _load_daily_rows():
-    """Load view and clone CSV rows, returning (view_rows, clone_rows)."""
-    view_rows = []
-    clone_rows = []
-    if VIEWS_CSV.exists():
-        with open(VIEWS_CSV, newline="") as f:
-            view_rows = list(csv.DictReader(f))
-    if CLONES_CSV.exists():
-        with open(CLONES_CSV, newline="") as f:
-            clone_rows = list(csv.DictReader(f))
-    return view_rows, clone_rows
+def api_graphql(query, variables, token):
+    """
+    Run a GraphQL query, served from the response cache while fresh.
+    Returns the response JSON ({"data": ..., "errors": ...}), or None on failure.
+    """
+    payload = {"query": query, "variables": variables}
+    cache_key = "/graphql " + json.dumps(payload, sort_keys=True)
+    cached = cache_get(cache_key, token) if USE_CACHE else None
+    if cached and time.time() - cached["fetched"] < cache_ttl(cache_key):
+        return cached["body"]
+
+    resp = _send("POST", "/graphql", token, json=payload)
+    if resp is None:
+        return None
+    if resp.status_code != 200:
+        print(f"  ⚠ HTTP {resp.status_code} for /graphql: {resp.text[:200]}")
+        return None
+    body = resp.json()
+    # Only cache complete answers, so failed repos are asked again next time
+    if USE_CACHE and not body.get("errors"):
+        cache_put(cache_key, token, None, body)
+    return body
+
+
+def fetch_repo_stats_bulk(repos, token, batch=GRAPHQL_BATCH):
+    """
+    Fetch stars, forks, and watchers for many repos with one GraphQL query
+    per `batch` repos. Repos enumerated earlier in this run are answered
+    from REPO_METADATA; repos missing from the answers fall back to REST.
+    Returns dict of repo -> (stars, forks, watchers)
+    """
+    repos = list(repos)
+    stats = {}
+    for repo in repos:
+        meta = REPO_METADATA.get(repo)
+        if meta and meta["watchers"] is not None:
+            stats[repo] = (meta["stars"], meta["forks"], meta["watchers"])
+    repos = [repo for repo in repos if repo not in stats]
+    for start in range(0, len(repos), batch):
+        chunk = repos[start:start + batch]
+        params = ", ".join(f"$o{i}: String!, $n{i}: String!" for i in range(len(chunk)))
+        fields = " ".join(
+            f"r{i}: repository(owner: $o{i}, name: $n{i}) "
+            f"{{ stargazerCount forkCount watchers {{ totalCount }} }}"
+            for i in range(len(chunk))
+        )
+        variables = {}
+        for i, repo in enumerate(chunk):
+            variables[f"o{i}"], _, variables[f"n{i}"] = repo.partition("/")
+        body = api_graphql(f"query({params}) {{ {fields} }}", variables, token)
+        data = (body or {}).get("data") or {}
+        for i, repo in enumerate(chunk):
+            node = data.get(f"r{i}")
+            if node:
+                stats[repo] = (node["stargazerCount"], node["forkCount"], node["watchers"]["totalCount"])
+
+    for repo in repos:
+        if repo not in stats:
+            stats[repo] = fetch_repo_stats(repo, token)
+    return stats
+
+
+def _load_monthly_rows():
+    """Load the per-(repo, month) view and clone rollups, returning (view_rows, clone_rows)."""
+    if not (DB_PATH.exists() or VIEWS_CSV.exists() or CLONES_CSV.exists()):
+        return [], []
+    conn = open_db()
+    conn.row_factory = sqlite3.Row
+    try:
+        return tuple(
+            [dict(row) for row in conn.execute(f"SELECT * FROM {kind}_monthly")] for kind in TRAFFIC_FIELDS
+        )
+    finally:
+        conn.close()
+
+
+# ── Columnar format ───────────────────────────────────────────────────────────
+# File layout: 8-byte magic, uint32 header length, JSON header, then one
+# 8-byte aligned little-endian array per column. Repo names are stored once
+# in the header and referenced by uint32 code; dates are int32 days since
+# 1970-01-01 and collected times int64 epoch seconds. Rows are sorted by
+# (repo, date).
+COLUMNAR_MAGIC = b"GHTCOL01"
+
+
+def _numpy():
+    """Import NumPy for the columnar format, installing it on first use."""
+    try:
+        import numpy
+    except ImportError:
+        print("Installing numpy...")
+        import subprocess
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "numpy", "-q"])
+        import numpy
+    return numpy
+
+
+def columnar_path(kind):
+    return VIEWS_COL if kind == "views" else CLONES_COL
+
+
+def write_columnar(path, kind, rows):
+    """Write daily "views" or "clones" rows (dicts as stored in the database) to a columnar file."""
+    np = _numpy()
+    rows = sorted(rows, key=lambda r: (r["repo"], r["date"]))
+    repos = sorted({r["repo"] for r in rows})
+    codes = {repo: i for i, repo in enumerate(repos)}
+    columns = {
+        "repo": np.array([codes[r["repo"]] for r in rows], dtype="<u4"),
+        "date": np.array([r["date"] for r in rows], dtype="datetime64[D]").astype("<i4"),
+        kind: np.array([int(r[kind]) for r in rows], dtype="<i4"),
+        f"unique_{kind}": np.array([int(r[f"unique_{kind}"]) for r in rows], dtype="<i4"),
+        "collected": np.array(
+            [datetime.fromisoformat(r["collected"]).timestamp() for r in rows], dtype="<i8"
+        ),
+    }
+
+    offset = 0
+    layout = []
+    for name, array in columns.items():
+        layout.append({"name": name, "dtype": array.dtype.str, "offset": offset})
+        offset += -(-array.nbytes // 8) * 8
+    header = json.dumps({"kind": kind, "rows": len(rows), "repos": repos, "columns": layout}).encode()
+    data_start = -(-(len(COLUMNAR_MAGIC) + 4 + len(header)) // 8) * 8
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(COLUMNAR_MAGIC + struct.pack("<I", len(header)) + header)
+        for column, array in zip(layout, columns.values()):
+            f.seek(data_start + column["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+
+
+def load_columnar(path):
+    """
+    Memory-map a columnar file.
+    Returns (kind, repos, columns): the repo name list for the codes in
+    columns["repo"], and dict of column name -> read-only NumPy array
+    """
+    np = _numpy()
+    with open(path, "rb") as f:
+        prefix = f.read(len(COLUMNAR_MAGIC) + 4)
+        if prefix[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+            raise ValueError(f"{path} is not a gh_traffic columnar file")
+        (header_len,) = struct.unpack("<I", prefix[len(COLUMNAR_MAGIC):])
+        header = json.loads(f.read(header_len))
+    data_start = -(-(len(COLUMNAR_MAGIC) + 4 + header_len) // 8) * 8
+    columns = {}
+    for column in header["columns"]:
+        if header["rows"] == 0:
+            columns[column["name"]] = np.zeros(0, dtype=column["dtype"])
+            continue
+        columns[column["name"]] = np.memmap(
+            path, dtype=column["dtype"], mode="r",
+            offset=data_start + column["offset"], shape=(header["rows"],)
+        )
+    return header["kind"], header["repos"], columns
+
+
+def csv_to_columnar(csv_path, col_path, kind):
+    """Convert a daily gh_views.csv / gh_clones.csv log to a columnar file (latest collected row per day wins)."""
+    latest = {}
+    with open(csv_path, newline="") as f:
+        for row in csv.DictReader(f):
+            key = (row["repo"], row["date"])
+            if key not in latest or row["collected"] >= latest[key]["collected"]:
+                latest[key] = row
+    write_columnar(col_path, kind, latest.values())
+    return len(latest)
+
+
+def columnar_to_csv(col_path, csv_path):
+    """Write a columnar file back out as a daily CSV log."""
+    kind, repos, columns = load_columnar(col_path)
+    dates = columns["date"].astype("datetime64[D]").astype(str)
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=TRAFFIC_FIELDS[kind])
+        writer.writeheader()
+        for i in range(len(dates)):
+            writer.writerow({
+                "repo": repos[columns["repo"][i]],
+                "date": dates[i],
+                kind: int(columns[kind][i]),
+                f"unique_{kind}": int(columns[f"unique_{kind}"][i]),
+                "collected": datetime.fromtimestamp(int(columns["collected"][i]), timezone.utc).isoformat(),
+            })
+    return len(dates)
+
+
+def db_to_columnar(kind):
+    """Write the database's daily rows of one kind to its columnar file. Returns the row count."""
+    conn = open_db()
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = [dict(row) for row in conn.execute(f"SELECT * FROM {kind}")]
+    finally:
+        conn.close()
+    write_columnar(columnar_path(kind), kind, rows)
+    return len(rows)
+
+
+def _load_monthly_rows_columnar():
+    """
+    Aggregate the columnar files per (repo, month) with NumPy.
+    Returns (view_rows, clone_rows) shaped like the database rollups
+    """
+    np = _numpy()
+    result = []
+    for kind in TRAFFIC_FIELDS:
+        path = columnar_path(kind)
+        if not path.exists():
+            result.append([])
+            continue
+        _, repos, columns = load_columnar(path)
+        if not len(columns["repo"]):
+            result.append([])
+            continue
+        months = columns["date"].astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        first_month = months.min()
+        span = months.max() - first_month + 1
+        keys, groups = np.unique(columns["repo"].astype(np.int64) * span + (months - first_month),
+                                 return_inverse=True)
+        totals = np.zeros(len(keys), dtype=np.int64)
+        uniques = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(totals, groups, columns[kind])
+        np.add.at(uniques, groups, columns[f"unique_{kind}"])
+        labels = (first_month + keys % span).astype("datetime64[M]").astype(str)
+        result.append([
+            {"repo": repos[code], "month": month, kind: int(total), f"unique_{kind}": int(unique)}
+            for code, month, total, unique in zip((keys // span).tolist(), labels, totals, uniques)
+        ])
+    return tuple(result)
 
 
 def _build_month_keys(view_rows, clone_rows):
@@ -212,9 +807,15 @@ def _build_month_keys(view_rows, clone_rows):
     return months
 
 
-def print_summary(token=None, overview=True, top=12):
-    """Print a summary of stored traffic data with live repo stats and monthly breakdown."""
-    view_rows, clone_rows = _load_daily_rows()
+def print_summary(token=None, overview=True, top=12, source="db"):
+    """
+    Print a summary of stored traffic data with live repo stats and monthly breakdown.
+    source is "db" (monthly rollups) or "columnar" (the .col files, aggregated with NumPy).
+    """
+    if source == "columnar":
+        view_rows, clone_rows = _load_monthly_rows_columnar()
+    else:
+        view_rows, clone_rows = _load_monthly_rows()
 
     if not view_rows and not clone_rows:
         print("\n  No data yet. Run a collection first.\n")
@@ -235,33 +836,28 @@ def print_summary(token=None, overview=True, top=12):
         repo = row["repo"]
         if repo not in repos:
             repos[repo] = {k: (dict(v) if isinstance(v, dict) else v) for k, v in empty.items()}
-        repos[repo]["views"] += int(row["views"])
-        repos[repo]["unique_views"] += int(row["unique_views"])
-        date = row["date"]
-        y, m = int(date[:4]), int(date[5:7])
+        repos[repo]["views"] += row["views"]
+        repos[repo]["unique_views"] += row["unique_views"]
+        y, m = int(row["month"][:4]), int(row["month"][5:7])
         if y == current_year:
-            repos[repo]["year_views"] += int(row["views"])
-        key = (y, m)
-        repos[repo]["month_views"][key] = repos[repo]["month_views"].get(key, 0) + int(row["views"])
+            repos[repo]["year_views"] += row["views"]
+        repos[repo]["month_views"][(y, m)] = row["views"]
 
     for row in clone_rows:
         repo = row["repo"]
         if repo not in repos:
             repos[repo] = {k: (dict(v) if isinstance(v, dict) else v) for k, v in empty.items()}
-        repos[repo]["clones"] += int(row["clones"])
-        repos[repo]["unique_clones"] += int(row["unique_clones"])
-        date = row["date"]
-        y, m = int(date[:4]), int(date[5:7])
+        repos[repo]["clones"] += row["clones"]
+        repos[repo]["unique_clones"] += row["unique_clones"]
+        y, m = int(row["month"][:4]), int(row["month"][5:7])
         if y == current_year:
-            repos[repo]["year_clones"] += int(row["clones"])
-        key = (y, m)
-        repos[repo]["month_clones"][key] = repos[repo]["month_clones"].get(key, 0) + int(row["clones"])
+            repos[repo]["year_clones"] += row["clones"]
+        repos[repo]["month_clones"][(y, m)] = row["clones"]
 
     # Fetch live repo stats if token is available
     has_stats = token is not None
     if has_stats:
-        for repo in repos:
-            stars, forks, watchers = fetch_repo_stats(repo, token)
+        for repo, (stars, forks, watchers) in fetch_repo_stats_bulk(sorted(repos), token).items():
             repos[repo].update({"stars": stars, "forks": forks, "watchers": watchers})
 
     # ── Overview table ────────────────────────────────────────────────────
@@ -369,8 +965,14 @@ def print_summary(token=None, overview=True, top=12):
     print(f"{'='*table_w}\n")
 
 
-def fetch_and_collect(orgs=None, repos=None, token=None, test=False, verbose=True):
-    """Collect traffic data for given orgs/repos. Callable from other scripts."""
+def fetch_and_collect(orgs=None, repos=None, token=None, test=False, verbose=True, workers=WORKERS):
+    """
+    Collect traffic data for given orgs/repos. Callable from other scripts.
+
+    The views and clones requests of all repos run on a pool of `workers`
+    threads sharing one keep-alive session; rows are handed back to this
+    thread, which is the only one writing to the database.
+    """
     if orgs is None:
         orgs = DEFAULT_ORGS
     if repos is None:
@@ -381,43 +983,63 @@ def fetch_and_collect(orgs=None, repos=None, token=None, test=False, verbose=Tru
     for org in orgs:
         if verbose:
             print(f"→ Listing repos for '{org}'...")
-        org_repos = list_org_repos(org, token)
+        org_repos = list_owner_repos(org, token)
         if verbose:
-            print(f"  Found {len(org_repos)} repo(s).")
-        repos.extend(org_repos)
+            archived = sum(1 for r in org_repos if r["archived"])
+            private = sum(1 for r in org_repos if r["private"])
+            print(f"  Found {len(org_repos)} repo(s) ({private} private, {archived} archived).")
+        repos.extend(r["full_name"] for r in org_repos)
 
     if not repos:
         if verbose:
             print("No repos found.")
         return
 
-    # Create data directory
-    if not test:
-        DATA_DIR.mkdir(parents=True, exist_ok=True)
-
     if verbose:
         print(f"\n→ Collecting traffic for {len(repos)} repo(s)...")
-    total_views = 0
-    total_clones = 0
-    for repo in sorted(repos):
-        views, clones = fetch_and_log_traffic(repo, token, test=test)
-        if verbose:
-            status = f"{views} view days, {clones} clone days"
-            if test:
-                status += " (dry run)"
-            print(f"  {repo:<40} {status}")
-        total_views += views
-        total_clones += clones
-
-    # Deduplicate after collection (handles overlapping 14-day windows)
+    collected = datetime.now(timezone.utc).isoformat()
+    rows = {kind: [] for kind in TRAFFIC_FIELDS}
+    counts = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(fetch_traffic, repo, kind, token, collected): (repo, kind)
+            for repo in sorted(set(repos)) for kind in TRAFFIC_FIELDS
+        }
+        for future in concurrent.futures.as_completed(futures):
+            repo, kind = futures[future]
+            # A malformed response skips this repo and kind, not the whole collection
+            try:
+                new_rows = future.result()
+            except Exception as e:
+                print(f"  ⚠ Cannot collect {kind} for {repo}: {e!r}")
+                counts.setdefault(repo, {})[kind] = None
+            else:
+                rows[kind].extend(new_rows)
+                counts.setdefault(repo, {})[kind] = len(new_rows)
+            if verbose and len(counts[repo]) == len(TRAFFIC_FIELDS):
+                status = ", ".join(
+                    f"{k[:-1]} days failed" if counts[repo][k] is None else f"{counts[repo][k]} {k[:-1]} days"
+                    for k in TRAFFIC_FIELDS
+                )
+                if test:
+                    status += " (dry run)"
+                print(f"  {repo:<40} {status}")
+
+    # Overlapping 14-day windows update the days already stored
     if not test:
-        for csv_file in [VIEWS_CSV, CLONES_CSV]:
-            deduplicate_csv(csv_file, verbose=verbose)
+        conn = open_db()
+        try:
+            for kind, kind_rows in rows.items():
+                upsert_rows(conn, kind, kind_rows)
+        finally:
+            conn.close()
+    total_views = len(rows["views"])
+    total_clones = len(rows["clones"])
 
     if verbose:
         print(f"\nDone. Logged {total_views} view rows, {total_clones} clone rows.")
         if not test:
-            print(f"Data stored in {DATA_DIR}/")
+            print(f"Data stored in {DB_PATH}")
 
 
 def main():
@@ -436,7 +1058,15 @@ def main():
     )
     collect.add_argument(
         "--test", action="store_true",
-        help="Dry run — print what would be logged without writing CSVs"
+        help="Dry run — print what would be logged without writing to the database"
+    )
+    collect.add_argument(
+        "--no-cache", action="store_true",
+        help="Bypass the on-disk API response cache"
+    )
+    collect.add_argument(
+        "--workers", type=int, default=WORKERS,
+        help=f"Concurrent API requests (default: {WORKERS}, max: {HTTP_POOL_SIZE})"
     )
 
     # summary subcommand
@@ -445,15 +1075,74 @@ def main():
         "--top", type=int, default=12,
         help="Number of repos to show in monthly tables (default: 12)"
     )
+    summary.add_argument(
+        "--no-cache", action="store_true",
+        help="Bypass the on-disk API response cache"
+    )
+    summary.add_argument(
+        "--format", choices=["db", "columnar"], default="db",
+        help="Read the database rollups (default) or the columnar files written by convert"
+    )
+
+    # import subcommand
+    sub.add_parser("import", help="Import the legacy gh_views.csv / gh_clones.csv logs into the database")
+
+    # convert subcommand
+    convert = sub.add_parser("convert", help="Convert the daily history to or from the columnar format")
+    convert.add_argument(
+        "--to", choices=["columnar", "csv"], required=True,
+        help="columnar: write gh_views.col / gh_clones.col; csv: export them to gh_views_export.csv / gh_clones_export.csv"
+    )
+    convert.add_argument(
+        "--from-csv", action="store_true",
+        help="With --to columnar, read the CSV logs instead of the database"
+    )
 
     args = parser.parse_args()
 
-    if args.command == "summary":
+    global USE_CACHE
+    USE_CACHE = not getattr(args, "no_cache", False)
+
+    if args.command == "import":
+        conn = open_db()
+        try:
+            import_csvs(conn)
+        finally:
+            conn.close()
+        print(f"Data stored in {DB_PATH}")
+    elif args.command == "convert":
+        if args.to == "csv":
+            sources = [columnar_path(kind) for kind in TRAFFIC_FIELDS]
+        elif args.from_csv:
+            sources = [VIEWS_CSV, CLONES_CSV]
+        else:
+            sources = []
+        missing = [path.name for path in sources if not path.exists()]
+        if missing:
+            print(f"Error: {', '.join(missing)} not found in {DATA_DIR}.")
+            sys.exit(1)
+
+        for kind in TRAFFIC_FIELDS:
+            if args.to == "csv":
+                csv_path = VIEWS_EXPORT_CSV if kind == "views" else CLONES_EXPORT_CSV
+                count = columnar_to_csv(columnar_path(kind), csv_path)
+                print(f"  Wrote {count} rows to {csv_path.name}")
+            elif args.from_csv:
+                csv_path = VIEWS_CSV if kind == "views" else CLONES_CSV
+                count = csv_to_columnar(csv_path, columnar_path(kind), kind)
+                print(f"  Wrote {count} rows to {columnar_path(kind).name}")
+            else:
+                count = db_to_columnar(kind)
+                print(f"  Wrote {count} rows to {columnar_path(kind).name}")
+    elif args.command == "summary":
         token = os.environ.get("GITHUB_TOKEN")
-        print_summary(token, top=args.top)
+        print_summary(token, top=args.top, source=args.format)
     elif args.command == "collect":
+        if not 1 <= args.workers <= HTTP_POOL_SIZE:
+            parser.error(f"--workers must be between 1 and {HTTP_POOL_SIZE}")
         token = get_token()
-        fetch_and_collect(orgs=args.orgs, repos=args.repos, token=token, test=args.test)
+        fetch_and_collect(orgs=args.orgs, repos=args.repos, token=token, test=args.test,
+                          workers=args.workers)
     else:
         parser.print_help()
 